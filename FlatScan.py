@@ -5,24 +5,1489 @@ import os
 import sys
 import re
 import json
-import glob
 import math
+import fnmatch
+import argparse
 import csv
+import io
+import bisect
+import collections
+import time
+import queue
+import ctypes
+import threading
+import hashlib
+import uuid
+import socket
+import zipfile
+import shutil
+import gzip
+import contextlib
+import itertools
+import warnings
+import mimetypes
+import multiprocessing
+from multiprocessing import shared_memory
 from datetime import datetime
-import chardet
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from chardet.universaldetector import UniversalDetector
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+try:
+    import zstandard    # 可选依赖，未安装时不支持 .zst 压缩文件
+except ImportError:
+    zstandard = None
 import numpy as np
 from scipy import interpolate
-import matplotlib.pyplot as plt
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from mpl_toolkits.mplot3d import Axes3D
+from PIL import Image, ImageDraw, ImageFont
 
-from PySide6.QtWidgets import QApplication, QMainWindow, QFileDialog
+from PySide6.QtWidgets import QApplication, QMainWindow, QFileDialog, QLabel, QHeaderView
 from PySide6.QtGui import QIcon
-from PySide6.QtCore import QThread, Signal, QCoreApplication
+from PySide6.QtCore import QThread, Signal, QTimer, Qt, QAbstractTableModel, QModelIndex
 
 import resource_rc
 from MainWindow_ui import Ui_MainWindow
 
 
+RESULT_HEADER = ["文件名", "日期", "时间", "板编号", "量测位置", "中心形貌", "平整度"]
+RESULT_FIELDS = ["file", "date", "time", "sn", "location", "shape", "flatness"]
+DIFFERENCE_HEADER = ["文件名", "板编号", "量测位置", "前次文件", "前次日期", "前次时间", "前次平整度", "平整度", "平整度变化"]
+LEASE_DIRNAME = ".flatscan_leases"    # 多工作站租约文件夹，位于数据文件夹中
+FILE_LOCK_OFFSET = 1 << 62              # Windows 文件锁锁定的字节位置，远超任何文件的实际大小
+COMPRESSED_SUFFIXES = (".gz", ".zst")   # 支持直接读取的压缩数据文件后缀
+
+
+# 默认配置
+DEFAULT_CONFIG = {
+    "dataDirectory": "D:\\",
+    "centralZoneLimit": 0.5,
+    "rbfFunction": "thin_plate",
+    "colorMap": "rainbow",
+    "plotDPI": 100,
+    "plot2DRenderer": "matplotlib",
+    "gridMinSize": 20,
+    "gridMaxSize": 200,
+    "gridPointsFactor": 4,
+    "surfaceGridMaxSize": 40,
+    "interpolationMaxPoints": 400,
+    "layoutCacheMB": 256,
+    "renderTimeBudget": 60,
+    "scanDirectoryInterval": 30,
+    "filesFilter": "*平整度*.txt",
+    "excludeFilter": "",
+    "archiveFilter": "",
+    "encodingSampleSize": 262144,
+    "inputFormat": "auto",
+    "maxScanDepth": -1,
+    "locationFilter": "BGA",
+    "regionalAnalysis": False,
+    "regionalGrid": [4, 4],
+    "regionalOutputFile": "{filename}_regional.npz",
+    "filenameReplPattern": "^(.*?)(\\-\\d{5})?$",
+    "filenameReplResult": "\\1",
+    "output2DFile": "{filename}_{sn}_{location}_2D.jpg",
+    "output3DFile": "{filename}_{sn}_{location}_3D.jpg",
+    "outputSheetFile": "{filename}_{sn}_sheet.jpg",
+    "renderMode": "single",
+    "imageArchive": "none",
+    "imageArchiveFile": "{filename}_images.zip",
+    "imageArchiveDailyFile": "images_{date}.zip",
+    "differenceMaps": False,
+    "differenceOutputFile": "{filename}_{sn}_{location}_diff.jpg",
+    "differenceResultFile": "{filename}_diff.csv",
+    "differenceCacheDirectory": "grid_cache",
+    "differenceCacheSize": 256,
+    "differenceCacheDays": 7,
+    "workerMaxTasks": 500,
+    "workerMaxRssMB": 800,
+    "memoryLogInterval": 600,
+    "eventLogFile": "logs/events.jsonl",
+    "eventLogMaxMB": 20,
+    "eventLogRotateHours": 24,
+    "eventLogBackups": 30,
+    "spcEnabled": True,
+    "spcSigma": 3,
+    "spcMinSamples": 25,
+    "spcFlatnessLimit": 0,
+    "spcStateFile": "spc_state.json",
+    "multiStation": False,
+    "stationName": "",
+    "leaseDirectory": "",
+    "leaseTimeout": 120,
+    "queryServiceHost": "127.0.0.1",
+    "queryServicePort": 8780,
+    "metricsPort": 9780,
+    "autoStart": True
+}
+
+
+class OperationCancelled(Exception):
+    # 分析任务被取消
+    pass
+
+
+class CancelToken:
+    # 协作式取消标记，各处理阶段在分块边界调用 check()，已取消时抛出 OperationCancelled
+    def __init__(self):
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+
+    def reset(self):
+        self._event.clear()
+
+    def check(self):
+        if self._event.is_set():
+            raise OperationCancelled()
+
+    def wait(self, timeout):
+        # 等待指定秒数，取消时立即返回
+        return self._event.wait(timeout)
+
+
+def app_file_path(filename):
+    # 返回程序所在目录下的文件路径
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+
+
+def read_config():
+    # 读取程序目录下的 config.json 并与默认配置合并，返回 (配置, 配置文件是否有效)
+    config = dict(DEFAULT_CONFIG)
+    try:
+        with open(app_file_path("config.json"), 'r', encoding='utf-8') as f:
+            config.update(json.load(f))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return config, False
+    return config, True
+
+
+def strip_compression(name):
+    # 去除压缩文件后缀，例如 a.txt.gz -> a.txt
+    lower = name.lower()
+    for suffix in COMPRESSED_SUFFIXES:
+        if lower.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def archive_members(archive):
+    # 返回 ZIP 压缩包中 {成员名: ZipInfo}；未标记 UTF-8 的成员名按 UTF-8、GBK 重新解码（Windows 中文系统创建的压缩包）
+    members = {}
+    for info in archive.infolist():
+        name = info.filename
+        if not info.flag_bits & 0x800:
+            raw = name.encode('cp437')
+            for encoding in ('utf-8', 'gbk'):
+                try:
+                    name = raw.decode(encoding)
+                    break
+                except UnicodeDecodeError:
+                    continue
+        members[name] = info
+    return members
+
+
+def split_archive_path(file_path):
+    # ZIP 压缩包中的数据文件表示为 "压缩包路径/成员名"，返回 (压缩包路径, 成员名)；普通文件返回 (file_path, None)
+    if os.path.isfile(file_path):
+        return file_path, None
+    archive = os.path.dirname(file_path)
+    while archive and archive != os.path.dirname(archive):
+        if os.path.isfile(archive):
+            return archive, os.path.relpath(file_path, archive).replace(os.sep, "/")
+        archive = os.path.dirname(archive)
+    return file_path, None
+
+
+def file_version(stat):
+    # 数据文件的版本 (修改时间, 大小)，ZIP 压缩包中的文件使用压缩包的修改时间和大小
+    return stat.st_mtime_ns, stat.st_size
+
+
+@contextlib.contextmanager
+def open_input(file_path):
+    # 以二进制流打开数据文件，.gz、.zst 文件及 ZIP 压缩包中的文件边读取边解压，不生成临时文件
+    archive, member = split_archive_path(file_path)
+    if member is not None:
+        with zipfile.ZipFile(archive) as z:
+            info = archive_members(z).get(member)
+            if info is None:
+                raise FileNotFoundError(f"压缩包 {archive} 中没有文件 {member}")
+            with z.open(info) as f:
+                yield f
+    elif file_path.lower().endswith(".gz"):
+        with gzip.open(file_path, 'rb') as f:
+            yield f
+    elif file_path.lower().endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("未安装 zstandard，无法读取 .zst 压缩文件")
+        with open(file_path, 'rb') as raw, zstandard.ZstdDecompressor().stream_reader(raw) as f:
+            yield f
+    else:
+        with open(file_path, 'rb') as f:
+            yield f
+
+
+# 点表格各字段可以使用的列名（不区分大小写，忽略空格）
+POINT_TABLE_COLUMNS = {
+    'sn': ('sn', 'serial', '板编号', '编号'),
+    'location': ('location', 'feature', '量测位置', '位置'),
+    'date': ('date', '日期'),
+    'time': ('time', '时间'),
+    'x': ('x', 'x坐标'),
+    'y': ('y', 'y坐标'),
+    'z': ('z', 'z坐标'),
+}
+
+
+def point_table_header(line, delimiter=None):
+    # 解析点表格的表头，返回 {字段: 列号}；delimiter 为 None 时按空白字符分列（固定列宽），缺少必需的列时返回 None
+    names = [name.strip().strip('"').lower().replace(' ', '')
+             for name in (line.split(delimiter) if delimiter else line.split())]
+    columns = {}
+    for field, aliases in POINT_TABLE_COLUMNS.items():
+        for index, name in enumerate(names):
+            if name in aliases:
+                columns[field] = index
+                break
+    if not {'sn', 'location', 'x', 'y', 'z'} <= columns.keys():
+        return None
+    return columns
+
+
+def point_table_delimiter(line):
+    # 识别点表格表头使用的分隔符，固定列宽（空白字符分列）时返回 None
+    return next((d for d in (',', ';', '\t') if d in line and point_table_header(line, d)), None)
+
+
+def first_line(sample):
+    return next((line.lstrip('\ufeff') for line in sample.splitlines() if line.strip()), '')
+
+
+# 数据文件格式：格式名称 -> (识别函数, FileAnalyzerThread 中的解析方法名)
+# inputFormat 为 auto 时按注册顺序用文件的第一个非空行逐个识别，最后注册的 report 格式总是匹配
+INPUT_FORMATS = collections.OrderedDict()
+
+
+def register_input_format(name, sniff, parser):
+    INPUT_FORMATS[name] = (sniff, parser)
+
+
+register_input_format('csv', lambda sample: point_table_delimiter(first_line(sample)) is not None, 'parse_point_table')
+register_input_format('fixed', lambda sample: point_table_header(first_line(sample)) is not None, 'parse_point_table')
+register_input_format('report', lambda sample: True, 'parse_report')
+
+
+class DirectoryScanner:
+    # 基于 os.scandir 的文件夹遍历器，包含/排除规则预先编译为单个正则表达式
+    # 压缩的数据文件（.gz、.zst）去除压缩后缀后按包含规则匹配；符合 archiveFilter 的 ZIP 压缩包也会返回
+    def __init__(self, filesFilter, excludeFilter="", maxDepth=-1, archiveFilter=""):
+        self.include_pattern = self.compile_patterns(filesFilter)
+        self.exclude_pattern = self.compile_patterns(excludeFilter)
+        self.archive_pattern = self.compile_patterns(archiveFilter)
+        self.max_depth = int(maxDepth)   # 小于0时不限制遍历深度，0表示仅扫描根目录
+
+    @staticmethod
+    def compile_patterns(patterns):
+        # 将以分号分隔的通配符字符串（或通配符列表）合并编译为一个正则表达式
+        if isinstance(patterns, str):
+            patterns = patterns.split(";")
+        patterns = [p.strip() for p in patterns if p and p.strip()]
+        if not patterns:
+            return None
+        flags = re.IGNORECASE if os.name == "nt" else 0
+        return re.compile("|".join(f"(?:{fnmatch.translate(p)})" for p in patterns), flags)
+
+    def scan(self, root, token=None):
+        # 遍历文件夹，返回 (文件夹路径, 文件的 DirEntry, 该文件夹中所有文件名集合)
+        # 文件名集合用于判断结果文件是否存在，避免对每个文件再调用 os.path.isfile
+        if self.include_pattern is None:
+            return
+        stack = [(root, 0)]
+        while stack:
+            if token is not None:
+                token.check()
+            dirpath, depth = stack.pop()
+            try:
+                with os.scandir(dirpath) as it:
+                    entries = list(it)
+            except OSError:
+                # 文件夹无法访问（权限不足或共享断开）时跳过
+                continue
+
+            names = set()
+            files = []
+            subdirs = []
+            for entry in entries:
+                names.add(entry.name)
+                if self.exclude_pattern is not None and self.exclude_pattern.match(entry.name):
+                    continue
+                try:
+                    # DirEntry 缓存了文件类型信息，is_dir/is_file 通常不需要额外的系统调用
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.max_depth < 0 or depth < self.max_depth:
+                            subdirs.append(entry.path)
+                    elif entry.is_file() and (self.include_pattern.match(strip_compression(entry.name))
+                                              or self.is_archive(entry.name)):
+                        files.append(entry)
+                except OSError:
+                    continue
+
+            files.sort(key=lambda e: e.name)
+            for entry in files:
+                yield dirpath, entry, names
+            subdirs.sort(reverse=True)
+            stack.extend((path, depth + 1) for path in subdirs)
+
+    def is_archive(self, name):
+        return self.archive_pattern is not None and self.archive_pattern.match(name) is not None
+
+    def members(self, archive_path):
+        # 返回 ZIP 压缩包中符合包含规则的数据文件名，压缩包损坏或无法读取时返回空列表
+        try:
+            with zipfile.ZipFile(archive_path) as z:
+                names = archive_members(z)
+        except (OSError, zipfile.BadZipFile):
+            return []
+        return sorted(name for name in names
+                      if not name.endswith("/") and self.include_pattern.match(name.rsplit("/", 1)[-1]))
+
+
+def scan_inputs(scanner, root, token=None):
+    # 扫描数据文件夹，逐个返回 (文件夹, 数据文件名, 不含扩展名的文件名, 结果文件路径, 结果文件是否已存在, DirEntry)
+    # ZIP 压缩包中的数据文件，结果文件及图片保存在压缩包所在的文件夹中，DirEntry 为压缩包的目录项
+    # DirEntry 缓存了 stat 信息（Windows 上遍历文件夹时已经取得），需要文件版本时不必再调用 os.stat
+    for dirpath, entry, names in scanner.scan(root, token):
+        if scanner.is_archive(entry.name):
+            inputs = [os.path.join(entry.name, member) for member in scanner.members(entry.path)]
+        else:
+            inputs = [entry.name]
+        for fullfilename in inputs:
+            filename, fileext = os.path.splitext(os.path.basename(strip_compression(fullfilename)))
+            yield (dirpath, fullfilename, filename, os.path.join(dirpath, filename + ".csv"), filename + ".csv" in names,
+                   entry)
+
+
+class P2Quantile:
+    # 使用 P² 算法单次遍历估计分位数，只需保存5个标记点，不需要保存历史数据
+    def __init__(self, p, state=None):
+        self.p = p
+        self.heights = []                           # 标记点高度
+        self.positions = [1, 2, 3, 4, 5]            # 标记点实际位置
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]     # 标记点期望位置
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+        if state:
+            self.heights, self.positions, self.desired = state['heights'], state['positions'], state['desired']
+
+    def to_dict(self):
+        return {'heights': self.heights, 'positions': self.positions, 'desired': self.desired}
+
+    def update(self, x):
+        q = self.heights
+        if len(q) < 5:
+            bisect.insort(q, x)
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(q, x) - 1
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # 调整中间三个标记点的高度
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                qp = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < qp < q[i + 1]:
+                    # 抛物线插值超出范围时使用线性插值
+                    qp = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+    def value(self):
+        q = self.heights
+        if not q:
+            return None
+        if len(q) < 5:
+            return q[min(int(round(self.p * (len(q) - 1))), len(q) - 1)]
+        return q[2]
+
+
+class RunningStats:
+    # 流式统计量：使用 Welford 算法计算均值和标准差，P² 算法估计分位数
+    PERCENTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.count = state.get('count', 0)
+        self.mean = state.get('mean', 0.0)
+        self.m2 = state.get('m2', 0.0)
+        self.min = state.get('min')
+        self.max = state.get('max')
+        quantiles = state.get('quantiles', {})
+        self.quantiles = {p: P2Quantile(p, quantiles.get(str(p))) for p in self.PERCENTILES}
+
+    def update(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = x if self.min is None else min(self.min, x)
+        self.max = x if self.max is None else max(self.max, x)
+        for quantile in self.quantiles.values():
+            quantile.update(x)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def control_limits(self, sigma):
+        # 返回控制下限和控制上限（均值 ± sigma 倍标准差）
+        return self.mean - sigma * self.std, self.mean + sigma * self.std
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'm2': self.m2,
+            'min': self.min,
+            'max': self.max,
+            'quantiles': {str(p): q.to_dict() for p, q in self.quantiles.items()},
+        }
+
+    def summary(self, sigma):
+        lcl, ucl = self.control_limits(sigma)
+        result = {
+            'count': self.count,
+            'mean': round(self.mean, 6),
+            'std': round(self.std, 6),
+            'min': self.min,
+            'max': self.max,
+            'lcl': round(lcl, 6),
+            'ucl': round(ucl, 6),
+        }
+        for p, q in self.quantiles.items():
+            value = q.value()
+            result[f'p{int(p * 100)}'] = None if value is None else round(value, 6)
+        return result
+
+
+class SpcMonitor:
+    # 按量测位置、按产品+量测位置分别累计平整度的统计过程控制数据，并判断是否超出控制限
+    def __init__(self, state_file, sigma=3, min_samples=25, spec_limit=0):
+        self._lock = threading.Lock()
+        self.state_file = state_file
+        self.sigma = sigma
+        self.min_samples = min_samples
+        self.spec_limit = spec_limit
+        self.stats = {}     # 统计键 -> RunningStats，统计键为 "量测位置" 或 "产品|量测位置"
+        try:
+            with open(state_file, 'r', encoding='utf-8') as f:
+                self.stats = {key: RunningStats(state) for key, state in json.load(f).items()}
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    def update(self, product, location, flatness):
+        # 加入一个平整度结果，返回报警信息列表；先按已有数据判断控制限，再更新统计量
+        alarms = []
+        if self.spec_limit and flatness > self.spec_limit:
+            alarms.append(f"{product} {location} 平整度 {flatness} 超出规格上限 {self.spec_limit}")
+        with self._lock:
+            for key in (location, f"{product}|{location}"):
+                stats = self.stats.setdefault(key, RunningStats())
+                if stats.count >= self.min_samples:
+                    lcl, ucl = stats.control_limits(self.sigma)
+                    if flatness > ucl or flatness < lcl:
+                        alarms.append(
+                            f"{key.replace('|', ' ')} 平整度 {flatness} 超出控制限 [{lcl:.4f}, {ucl:.4f}]"
+                            f"（均值 {stats.mean:.4f}，样本数 {stats.count}）")
+                stats.update(flatness)
+        return alarms
+
+    def summary(self):
+        with self._lock:
+            return {key: stats.summary(self.sigma) for key, stats in self.stats.items()}
+
+    def save(self):
+        # 先写入临时文件再替换，避免程序中断时损坏统计状态
+        with self._lock:
+            state = {key: stats.to_dict() for key, stats in self.stats.items()}
+        temp_file = self.state_file + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(temp_file, self.state_file)
+
+
+class LeaseManager:
+    # 多工作站任务租约：只依赖共享文件夹，用 O_EXCL 原子创建租约文件声明任务，后台线程定期续约
+    # 过期判断只比较本机观察到的租约文件修改时间是否在 ttl 秒内没有变化，不受各工作站时钟偏差影响
+    def __init__(self, lease_dir, station, ttl):
+        self.lease_dir = lease_dir
+        self.station = station
+        self.ttl = float(ttl)
+        self.owner = f"{station}:{os.getpid()}:{uuid.uuid4().hex}"   # 本实例的唯一标识
+        self.held = {}          # 任务键 -> 租约文件路径
+        self.lost = set()       # 已被其它工作站接管的任务键
+        self._observed = {}     # 租约文件路径 -> (修改时间, 首次观察到该修改时间的本机时间)
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        os.makedirs(lease_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._heartbeat, daemon=True)
+        self._thread.start()
+
+    def lease_path(self, key):
+        return os.path.join(self.lease_dir, hashlib.sha1(key.lower().encode("utf-8")).hexdigest() + ".lease")
+
+    def _write(self, path, key, exclusive):
+        content = json.dumps({'owner': self.owner, 'station': self.station, 'key': key}, ensure_ascii=False)
+        if exclusive:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+        else:
+            temp = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(temp, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(temp, path)
+
+    def _read_owner(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('owner')
+        except (OSError, ValueError):
+            return None
+
+    def _expired(self, path):
+        # 租约文件的修改时间在 ttl 秒内没有变化时视为过期
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return True
+        now = time.monotonic()
+        observed = self._observed.get(path)
+        if observed is None or observed[0] != mtime:
+            self._observed[path] = (mtime, now)
+            return False
+        return now - observed[1] > self.ttl
+
+    def acquire(self, key):
+        # 尝试声明任务，成功返回 True；已被其它工作站持有且未过期时返回 False
+        path = self.lease_path(key)
+        try:
+            self._write(path, key, exclusive=True)
+        except FileExistsError:
+            if not self._expired(path) or not self._takeover(path, key):
+                return False
+        with self._lock:
+            self.held[key] = path
+            self.lost.discard(key)
+        self._observed.pop(path, None)
+        return True
+
+    def _takeover(self, path, key):
+        # 接管过期租约：先独占创建接管标记，确认租约仍未续约后再替换为自己的租约
+        marker = path + ".takeover"
+        try:
+            self._write(marker, key, exclusive=True)
+        except FileExistsError:
+            if self._expired(marker):
+                # 接管过程中崩溃遗留的标记
+                try:
+                    os.remove(marker)
+                except OSError:
+                    pass
+            return False
+        try:
+            if not self._expired(path):
+                return False
+            self._write(path, key, exclusive=False)
+            return True
+        finally:
+            try:
+                os.remove(marker)
+            except OSError:
+                pass
+
+    def is_held(self, key):
+        # 检查租约是否仍由本实例持有
+        with self._lock:
+            path = self.held.get(key)
+        return path is not None and self._read_owner(path) == self.owner
+
+    def release(self, key):
+        with self._lock:
+            path = self.held.pop(key, None)
+            self.lost.discard(key)
+        if path is not None and self._read_owner(path) == self.owner:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _heartbeat(self):
+        # 定期更新所持有租约文件的修改时间，租约被接管时记录为丢失
+        while not self._closed.wait(self.ttl / 3):
+            with self._lock:
+                held = list(self.held.items())
+            for key, path in held:
+                if self._read_owner(path) != self.owner:
+                    with self._lock:
+                        if key in self.held:
+                            self.lost.add(key)
+                    continue
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+
+    def close(self):
+        self._closed.set()
+        for key in list(self.held):
+            self.release(key)
+
+
+class EventLogger:
+    # 结构化事件日志：调用方只把事件放入队列，后台线程批量写入 JSON Lines 文件，写文件不占用分析线程的时间
+    # 文件超过 max_bytes 字节或写入超过 rotate_seconds 秒后轮转，轮转出的文件用 gzip 压缩，最多保留 backups 个
+    def __init__(self, path, max_bytes=0, rotate_seconds=0, backups=30):
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self.rotate_seconds = float(rotate_seconds)
+        self.backups = int(backups)
+        self._queue = queue.Queue()
+        self._started = None    # 当前文件第一条事件的时间
+        self._size = 0          # 当前文件大小（字节），包括尚未写入的行
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def emit(self, event, **fields):
+        self._queue.put((time.time(), event, fields))
+
+    def close(self, timeout=10):
+        # 写完队列中剩余的事件后退出后台线程
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    @staticmethod
+    def rotated_files(path):
+        # 已轮转的压缩日志文件，按文件名中的时间（同一秒内轮转多次时再按序号）排序
+        folder = os.path.dirname(os.path.abspath(path))
+        root, ext = os.path.splitext(os.path.basename(path))
+        if not os.path.isdir(folder):
+            return []
+        names = [name for name in os.listdir(folder) if name.startswith(root + ".") and name.endswith(ext + ".gz")]
+        return [os.path.join(folder, name) for name in sorted(names, key=lambda name: EventLogger.rotation_key(path, name))]
+
+    @staticmethod
+    def rotation_key(path, name):
+        # 轮转文件名为 名称.时间[-序号].jsonl.gz，返回 (时间, 序号)
+        root, ext = os.path.splitext(os.path.basename(path))
+        middle = os.path.basename(name)[len(root) + 1:-len(ext) - 3]
+        return middle[:15], int(middle[16:]) if middle[16:].isdigit() else 0
+
+    @staticmethod
+    def read(path):
+        # 按时间顺序读取所有事件（包括已轮转的文件），跳过异常退出时写了一半的行
+        files = EventLogger.rotated_files(path) + ([path] if os.path.isfile(path) else [])
+        for file_path in files:
+            opener = gzip.open if file_path.endswith(".gz") else open
+            with opener(file_path, 'rt', encoding='utf-8', errors='ignore') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            while items[-1] is not None:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            events = [item for item in items if item is not None]
+            try:
+                if events:
+                    self._write(events)
+            except OSError as e:
+                print(f"写入事件日志失败：{e}", file=sys.stderr)
+            if items[-1] is None:
+                break
+
+    def _write(self, events):
+        if self._started is None:
+            self._started = self._first_time() or events[0][0]
+            self._size = os.path.getsize(self.path) if os.path.isfile(self.path) else 0
+        lines = []
+        for ts, event, fields in events:
+            if self._should_rotate(ts):
+                self._append(lines)
+                lines = []
+                self._rotate()
+                self._started = ts
+                self._size = 0
+            record = {'ts': datetime.fromtimestamp(ts).isoformat(timespec='milliseconds'), 'event': event}
+            record.update(fields)
+            line = json.dumps(record, ensure_ascii=False, default=str)
+            lines.append(line)
+            self._size += len(line.encode('utf-8')) + 1
+        self._append(lines)
+
+    def _append(self, lines):
+        if lines:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+
+    def _first_time(self):
+        # 程序重启后继续写入已有文件时，以文件中第一条事件的时间作为轮转计时起点
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return datetime.fromisoformat(json.loads(f.readline())['ts']).timestamp()
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _should_rotate(self, ts):
+        if self._size <= 0:
+            return False
+        if self.max_bytes > 0 and self._size >= self.max_bytes:
+            return True
+        return self.rotate_seconds > 0 and ts - self._started >= self.rotate_seconds
+
+    def _rotate(self):
+        # 当前文件压缩为 名称.时间.jsonl.gz，之后删除超过保留数量的旧文件
+        root, ext = os.path.splitext(self.path)
+        stamp = datetime.fromtimestamp(self._started).strftime("%Y%m%d-%H%M%S")
+        # 同一秒内多次轮转时序号递增，旧文件被删除后也不会重复使用较小的序号
+        index = max((number + 1 for time_stamp, number in
+                     (self.rotation_key(self.path, name) for name in self.rotated_files(self.path))
+                     if time_stamp == stamp), default=0)
+        target = f"{root}.{stamp}-{index}{ext}.gz" if index else f"{root}.{stamp}{ext}.gz"
+        with open(self.path, 'rb') as src, gzip.open(target, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(self.path)
+        rotated = self.rotated_files(self.path)
+        for old in rotated[:max(len(rotated) - self.backups, 0)]:
+            os.remove(old)
+
+
+class ResultIndex:
+    # 平整度结果的内存索引：按列存储所有结果；板编号、量测位置、中心形貌、日期另外按值编号，
+    # 编号保存在 NumPy 数组中，查询时对整列做向量化比较，不逐行检查条件
+    CODED_FIELDS = ('sn', 'location', 'shape', 'date')
+    MAX_PATTERNS = 64
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.columns = {field: [] for field in RESULT_FIELDS}
+        self.size = 0               # 已加入的行数，包括已失效的行
+        self.count = 0              # 有效行数
+        self.alive = np.zeros(1024, dtype=bool)     # 行是否有效，结果文件被重新生成时旧行标记为无效
+        self.codes = {field: np.zeros(1024, dtype=np.int32) for field in self.CODED_FIELDS}
+        self.values = {field: [] for field in self.CODED_FIELDS}    # 编号 -> 值
+        self.lookup = {field: {} for field in self.CODED_FIELDS}    # 值 -> 编号
+        self.folded = {field: {} for field in self.CODED_FIELDS}    # 小写的值 -> 编号，仅大小写不同的多个值为编号元组
+        self.sources = {}           # 结果文件路径 -> 该文件对应的行号范围
+        self._patterns = collections.OrderedDict()  # (字段, 通配符) -> [正则表达式, 每个值是否匹配]
+        self._strings = {}
+
+    def __len__(self):
+        return self.count
+
+    def has_source(self, result_file):
+        return result_file in self.sources
+
+    def load_csv(self, result_file):
+        # 读取已经生成的平整度结果文件并加入索引
+        try:
+            with open(result_file, mode='r', newline='', encoding='gb2312', errors='ignore') as csvfile:
+                rows = list(csv.reader(csvfile))
+        except OSError:
+            return
+        self.add_rows(result_file, rows[1:])
+
+    def _reserve(self, size):
+        # 数组容量不足时按倍数扩大，避免每次加入都重新分配
+        capacity = len(self.alive)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.size] = self.alive[:self.size]
+        self.alive = alive
+        for field, codes in self.codes.items():
+            grown = np.zeros(capacity, dtype=np.int32)
+            grown[:self.size] = codes[:self.size]
+            self.codes[field] = grown
+
+    def add_rows(self, result_file, rows):
+        # 加入一个结果文件的所有数据行，同一文件重复加入时替换之前的数据
+        with self._lock:
+            old = self.sources.pop(result_file, None)
+            if old is not None:
+                self.count -= int(np.count_nonzero(self.alive[old.start:old.stop]))
+                self.alive[old.start:old.stop] = False
+            valid = []
+            for row in rows:
+                if len(row) < len(RESULT_FIELDS):
+                    continue
+                try:
+                    flatness = float(row[6])
+                except ValueError:
+                    continue
+                valid.append(row[:6] + [flatness])
+            start = self.size
+            stop = start + len(valid)
+            self._reserve(stop)
+            # 按列处理：复用已有的字符串对象，减少大量重复字符串的内存占用；编号列整段写入数组
+            for field, column in zip(RESULT_FIELDS, zip(*valid)):
+                if field == 'flatness':
+                    self.columns[field].extend(column)
+                    continue
+                column = [self._strings.setdefault(value, value) for value in column]
+                self.columns[field].extend(column)
+                if field in self.codes:
+                    lookup = self.lookup[field]
+                    folded = self.folded[field]
+                    values = self.values[field]
+                    for value in column:
+                        if value not in lookup:
+                            lookup[value] = len(values)
+                            # 编号保存为整数而不是列表，避免大量小对象增加垃圾回收的开销
+                            key = value.lower()
+                            code = folded.get(key)
+                            if code is None:
+                                folded[key] = len(values)
+                            else:
+                                folded[key] = (code if isinstance(code, tuple) else (code,)) + (len(values),)
+                            values.append(value)
+                    self.codes[field][start:stop] = [lookup[value] for value in column]
+            self.alive[start:stop] = True
+            self.size = stop
+            self.count += stop - start
+            self.sources[result_file] = range(start, stop)
+
+    def _pattern_table(self, field, pattern):
+        # 通配符对该字段每个不同值是否匹配（不区分大小写）；结果按模式缓存，之后只检查新出现的值
+        key = (field, pattern)
+        entry = self._patterns.get(key)
+        if entry is None:
+            entry = self._patterns[key] = [re.compile(fnmatch.translate(pattern), re.IGNORECASE),
+                                           np.zeros(0, dtype=bool)]
+            if len(self._patterns) > self.MAX_PATTERNS:
+                self._patterns.popitem(last=False)
+        else:
+            self._patterns.move_to_end(key)
+        regex, table = entry
+        values = self.values[field]
+        if len(table) < len(values):
+            added = values[len(table):]
+            matched = np.fromiter((regex.match(value) is not None for value in added), dtype=bool, count=len(added))
+            table = entry[1] = np.concatenate([table, matched])
+        return table
+
+    def _match(self, field, pattern):
+        # 返回每一行该字段是否符合精确值或通配符的布尔数组，与通配符一样不区分大小写
+        codes = self.codes[field][:self.size]
+        if not any(c in pattern for c in "*?["):
+            matched = self.folded[field].get(pattern.lower())
+            if matched is None:
+                return np.zeros(self.size, dtype=bool)
+            if isinstance(matched, tuple):
+                return np.isin(codes, matched)
+            return codes == matched
+        return self._pattern_table(field, pattern)[codes]
+
+    def query(self, sn=None, location=None, shape=None, date_from=None, date_to=None,
+              offset=0, limit=100, descending=False):
+        # 按条件查询结果，返回 (符合条件的总行数, 当前页的行列表)
+        with self._lock:
+            mask = None
+            for field, pattern in (('sn', sn), ('location', location), ('shape', shape)):
+                if pattern:
+                    matched = self._match(field, pattern)
+                    mask = matched if mask is None else mask & matched
+            if date_from or date_to:
+                # 不同日期的数量很少，先判断每个日期是否在范围内，再按编号映射到每一行
+                table = np.array([(not date_from or date >= date_from) and (not date_to or date <= date_to)
+                                  for date in self.values['date']], dtype=bool)
+                matched = table[self.codes['date'][:self.size]] if len(table) else np.zeros(self.size, dtype=bool)
+                mask = matched if mask is None else mask & matched
+
+            if mask is None:
+                # 无条件查询：总数直接取有效行数，只需找出有效行号再切出当前页
+                total = self.count
+                row_ids = np.arange(self.size) if self.count == self.size else np.flatnonzero(self.alive[:self.size])
+            else:
+                row_ids = np.flatnonzero(mask & self.alive[:self.size])
+                total = len(row_ids)
+            if descending:
+                row_ids = row_ids[::-1]
+            columns = self.columns
+            page = [{field: columns[field][row_id] for field in RESULT_FIELDS}
+                    for row_id in row_ids[offset:offset + limit].tolist()]
+            return total, page
+
+
+class Metrics:
+    # 运行指标：计数器、仪表和直方图，按 Prometheus 文本格式输出
+    HELP = {
+        'flatscan_files_discovered_total': ('counter', "扫描发现的待分析数据文件数"),
+        'flatscan_files_processed_total': ('counter', "分析完成的数据文件数"),
+        'flatscan_files_failed_total': ('counter', "分析失败的数据文件数"),
+        'flatscan_bgas_total': ('counter', "已计算平整度的量测位置数"),
+        'flatscan_bgas_per_second': ('gauge', "最近60秒平均每秒计算的量测位置数"),
+        'flatscan_backlog_files': ('gauge', "本轮扫描尚未分析的数据文件数"),
+        'flatscan_last_result_timestamp_seconds': ('gauge', "最近一次得到平整度结果的时间戳"),
+        'flatscan_seconds_since_last_result': ('gauge', "距离最近一次得到平整度结果的秒数"),
+        'flatscan_stage_seconds': ('histogram', "各处理阶段耗时（parse、fit、interpolate、render、write）"),
+    }
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    RATE_WINDOW = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {}        # (指标名称, 标签) -> 数值
+        self.histograms = {}    # (指标名称, 标签) -> [各区间计数..., 总和, 总数]
+        self.recent = collections.deque()  # 最近 RATE_WINDOW 秒内每个量测位置的完成时间
+        self.last_result = None
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * len(self.BUCKETS) + [0.0, 0]
+            position = bisect.bisect_left(self.BUCKETS, value)
+            if position < len(self.BUCKETS):
+                histogram[position] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def record_bga(self):
+        # 记录完成一个量测位置的平整度计算
+        now = time.time()
+        self.inc('flatscan_bgas_total')
+        with self._lock:
+            self.last_result = now
+            self.recent.append(now)
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        labels = tuple(labels) + tuple(extra)
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+    def render(self):
+        # 输出 Prometheus 文本格式
+        now = time.time()
+        with self._lock:
+            while self.recent and self.recent[0] < now - self.RATE_WINDOW:
+                self.recent.popleft()
+            values = dict(self.values)
+            values[('flatscan_bgas_per_second', ())] = len(self.recent) / self.RATE_WINDOW
+            if self.last_result is not None:
+                values[('flatscan_last_result_timestamp_seconds', ())] = self.last_result
+                values[('flatscan_seconds_since_last_result', ())] = now - self.last_result
+            histograms = {key: list(value) for key, value in self.histograms.items()}
+
+        lines = []
+        for name, (kind, help_text) in self.HELP.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                for (metric, labels), histogram in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.BUCKETS, histogram):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {histogram[-1]}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {histogram[-2]}")
+                    lines.append(f"{name}_count{self._labels(labels)} {histogram[-1]}")
+            else:
+                samples = [(labels, value) for (metric, labels), value in values.items() if metric == name]
+                if not samples and kind == 'counter':
+                    samples = [((), 0)]
+                for labels, value in sorted(samples):
+                    lines.append(f"{name}{self._labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class LocalHttpService:
+    # 在后台线程中运行的本地 HTTP 服务，routes 为 {路径: 处理函数}
+    # 处理函数接收查询参数字典，返回 (状态码, 内容类型, 内容字节)
+    def __init__(self, host, port, routes):
+        self.routes = routes
+
+        service = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                handler = service.routes.get(url.path)
+                if handler is None:
+                    status, content_type, body = 404, "text/plain; charset=utf-8", b"Not Found"
+                else:
+                    params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                    try:
+                        status, content_type, body = handler(params)
+                    except Exception as e:
+                        status, content_type, body = 400, "text/plain; charset=utf-8", str(e).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # 不在控制台输出访问日志
+                pass
+
+        self.server = ThreadingHTTPServer((host, int(port)), RequestHandler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.1,), daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsService(LocalHttpService):
+    # 运行指标服务：/metrics 输出 Prometheus 文本格式的运行指标
+    def __init__(self, host, port, metrics):
+        self.metrics = metrics
+        super().__init__(host, port, {"/metrics": self.handle_metrics})
+
+    def handle_metrics(self, params):
+        return 200, "text/plain; version=0.0.4; charset=utf-8", self.metrics.render().encode("utf-8")
+
+
+class ResultQueryService(LocalHttpService):
+    # 平整度结果查询服务：
+    #   /results      按条件分页查询，返回 JSON
+    #   /results.csv  按条件导出全部符合条件的结果为 CSV
+    #   /spc          各量测位置的SPC统计量及控制限
+    #   /image        取出图片归档中的单个图片，参数 archive 为相对数据文件夹的归档路径，name 为图片名称，
+    #                 省略 name 时列出归档中的所有图片
+    # 支持的查询参数：sn、location（可使用通配符）、shape、date_from、date_to、page、page_size、order=desc
+    def __init__(self, host, port, index, spc_monitor=None, image_root=None):
+        self.index = index
+        self.spc_monitor = spc_monitor
+        self.image_root = image_root
+        super().__init__(host, port, {
+            "/results": self.handle_results,
+            "/results.csv": self.handle_export,
+            "/spc": self.handle_spc,
+            "/image": self.handle_image,
+        })
+
+    def _filters(self, params):
+        return {
+            'sn': params.get('sn'),
+            'location': params.get('location'),
+            'shape': params.get('shape'),
+            'date_from': params.get('date_from'),
+            'date_to': params.get('date_to'),
+            'descending': params.get('order', '').lower() == 'desc',
+        }
+
+    def handle_results(self, params):
+        page = max(int(params.get('page', 1)), 1)
+        page_size = min(max(int(params.get('page_size', 100)), 1), 10000)
+        total, rows = self.index.query(offset=(page - 1) * page_size, limit=page_size, **self._filters(params))
+        body = json.dumps({'total': total, 'page': page, 'page_size': page_size, 'rows': rows}, ensure_ascii=False)
+        return 200, "application/json; charset=utf-8", body.encode("utf-8")
+
+    def handle_export(self, params):
+        total, rows = self.index.query(offset=0, limit=sys.maxsize, **self._filters(params))
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(RESULT_HEADER)
+        writer.writerows([row[field] for field in RESULT_FIELDS] for row in rows)
+        return 200, "text/csv; charset=utf-8", buffer.getvalue().encode("utf-8-sig")
+
+    def handle_spc(self, params):
+        summary = self.spc_monitor.summary() if self.spc_monitor is not None else {}
+        return 200, "application/json; charset=utf-8", json.dumps(summary, ensure_ascii=False).encode("utf-8")
+
+    def handle_image(self, params):
+        # 只允许读取数据文件夹内的归档文件
+        root = os.path.realpath(self.image_root or "")
+        archive = os.path.realpath(os.path.join(root, params['archive']))
+        if not self.image_root or os.path.commonpath([root, archive]) != root or not os.path.isfile(archive):
+            return 404, "text/plain; charset=utf-8", b"Not Found"
+        name = params.get('name')
+        if not name:
+            names = ImageArchive.list(archive)
+            return 200, "application/json; charset=utf-8", json.dumps(names, ensure_ascii=False).encode("utf-8")
+        try:
+            data = ImageArchive.read(archive, name)
+        except KeyError:
+            return 404, "text/plain; charset=utf-8", b"Not Found"
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        return 200, content_type, data
+
+
+class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+    # Windows GetProcessMemoryInfo 使用的结构体
+    _fields_ = [
+        ("cb", ctypes.c_ulong),
+        ("PageFaultCount", ctypes.c_ulong),
+        ("PeakWorkingSetSize", ctypes.c_size_t),
+        ("WorkingSetSize", ctypes.c_size_t),
+        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+        ("PagefileUsage", ctypes.c_size_t),
+        ("PeakPagefileUsage", ctypes.c_size_t),
+    ]
+
+
+def get_rss():
+    # 返回当前进程的常驻内存字节数，无法获取时返回0
+    try:
+        if os.name == "nt":
+            kernel32 = ctypes.windll.kernel32
+            psapi = ctypes.windll.psapi
+            kernel32.GetCurrentProcess.restype = ctypes.c_void_p
+            psapi.GetProcessMemoryInfo.argtypes = [
+                ctypes.c_void_p, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), ctypes.c_ulong]
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb)
+            return counters.WorkingSetSize
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, AttributeError, ValueError):
+        return 0
+
+
+def memory_usage():
+    # 返回当前进程的内存占用：常驻内存字节数、Python 已分配的内存块数
+    return {'rss': get_rss(), 'blocks': sys.getallocatedblocks()}
+
+
+def decimate_points(pos, max_points):
+    # 空间均匀抽样：将XY范围划分为约 max_points 个网格，每个网格保留最接近网格中心的点，
+    # 同时保留Z'最高和最低的点，使抽样后的颜色范围与平整度一致；max_points 不大于0时不抽样
+    if max_points <= 0 or len(pos) <= max_points:
+        return pos
+    x = pos[:, 0]
+    y = pos[:, 1]
+    rangeX = max(float(np.ptp(x)), 1e-9)
+    rangeY = max(float(np.ptp(y)), 1e-9)
+    nx = max(int(math.sqrt(max_points * rangeX / rangeY)), 1)
+    ny = max(int(max_points / nx), 1)
+    cellX = np.minimum(((x - x.min()) / rangeX * nx).astype(np.int64), nx - 1)
+    cellY = np.minimum(((y - y.min()) / rangeY * ny).astype(np.int64), ny - 1)
+    cell = cellX * ny + cellY
+    distance = (((x - x.min()) / rangeX * nx - cellX - 0.5) ** 2 +
+                ((y - y.min()) / rangeY * ny - cellY - 0.5) ** 2)
+    order = np.lexsort((distance, cell))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = cell[order][1:] != cell[order][:-1]
+    keep = np.union1d(order[first], [np.argmin(pos[:, 2]), np.argmax(pos[:, 2])])
+    return pos[keep]
+
+
+class LayoutCache:
+    # 量测点布局缓存：同一量测程序的板在相同的XY位置量测，只有Z值不同，按XY坐标的哈希值缓存与Z无关的矩阵
+    # 布局第二次出现时才计算并缓存（只出现一次的布局不增加额外计算），按最近使用顺序淘汰，总大小不超过 max_bytes
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._seen = collections.OrderedDict()      # 已出现过一次的布局
+        self._oversized = collections.OrderedDict() # 矩阵超过缓存上限的布局，不再计算
+
+    @staticmethod
+    def key(pos, *extra):
+        # 布局键：XY坐标的哈希值及影响缓存内容的参数
+        digest = hashlib.sha1(np.ascontiguousarray(pos[:, :2]).tobytes())
+        digest.update(repr(extra).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key, build, force=False, nbytes=None):
+        # 返回缓存的矩阵；布局第一次出现时返回 None，由调用方直接计算
+        # force 为 True 时调用方已知该布局会被多次使用（批量分析），第一次出现即计算并缓存
+        # nbytes 为调用方预估的矩阵大小；超过缓存上限的布局返回 None，不计算矩阵，调用方直接计算比计算矩阵更快
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        if self.max_bytes <= 0 or (nbytes is not None and nbytes > self.max_bytes) or key in self._oversized:
+            return None
+        if key not in self._seen and not force:
+            self._remember(self._seen, key)
+            return None
+        entry = build()
+        self._seen.pop(key, None)
+        nbytes = sum(value.nbytes for value in entry.values() if isinstance(value, np.ndarray))
+        if nbytes > self.max_bytes:
+            # 本次已经计算，仍然使用；之后该布局直接返回 None，不再重复计算
+            self._remember(self._oversized, key)
+            return entry
+        self._entries[key] = entry
+        self.size += nbytes
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= sum(value.nbytes for value in evicted.values() if isinstance(value, np.ndarray))
+        return entry
+
+    @staticmethod
+    def _remember(keys, key, limit=4096):
+        keys[key] = True
+        while len(keys) > limit:
+            keys.popitem(last=False)
+
+
+class SharedPointBuffer:
+    # 跨进程共享的量测点缓冲区，点数据写入后绘图进程直接映射为数组读取，不经过序列化
+    def __init__(self, size=1 << 20):
+        self.shm = None
+        self.reserve(size)
+
+    def reserve(self, nbytes):
+        # 缓冲区不足时按2的幂次重新分配
+        if self.shm is not None and self.shm.size >= nbytes:
+            return
+        self.close()
+        size = 1 << max(int(nbytes - 1).bit_length(), 20)
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+
+    def write(self, arrays):
+        # 将多个 N×3 数组依次写入缓冲区，返回 (共享内存名称, [(起始行, 行数), ...])
+        total = sum(len(a) for a in arrays)
+        self.reserve(total * 3 * 8)
+        points = np.ndarray((total, 3), dtype=np.float64, buffer=self.shm.buf)
+        slices = []
+        start = 0
+        for a in arrays:
+            points[start:start + len(a)] = a
+            slices.append((start, len(a)))
+            start += len(a)
+        del points
+        return self.shm.name, slices
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+def render_worker_main(config, tasks, results):
+    # 绘图工作进程入口：循环执行绘图任务，每个任务完成后返回错误信息及进程内存占用
+    plotter = FlatnessPlotter(config)
+    grid_cache = None
+    if config['differenceMaps']:
+        grid_cache = GridCache(app_file_path(config['differenceCacheDirectory']),
+                               config['differenceCacheSize'], config['differenceCacheDays'])
+    shm = None
+    count = 0
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        kind, dirpath, filename, shm_name, items = task
+        error = None
+        differences = []
+        timings = {'interpolate': 0.0, 'render': 0.0}
+        plotter.write_time = 0.0
+        try:
+            if shm is None or shm.name != shm_name:
+                if shm is not None:
+                    shm.close()
+                shm = shared_memory.SharedMemory(name=shm_name)
+            points = np.ndarray((shm.size // 24, 3), dtype=np.float64, buffer=shm.buf)
+            rawdata = [dict(meta, pos=points[start:start + rows]) for meta, start, rows in items]
+            if kind == 'single':
+                for data in rawdata:
+                    started = time.perf_counter()
+                    grid = plotter.interpolate(data)
+                    timings['interpolate'] += time.perf_counter() - started
+                    started = time.perf_counter()
+                    plotter.plot_3d(dirpath, filename, data, grid)
+                    plotter.plot_2d(dirpath, filename, data, grid)
+                    timings['render'] += time.perf_counter() - started
+                    if grid_cache is not None:
+                        differences += plotter.compare(grid_cache, dirpath, filename, [data], [grid], timings)
+            else:
+                started = time.perf_counter()
+                grids = [plotter.interpolate(data, surface=False) for data in rawdata]
+                timings['interpolate'] += time.perf_counter() - started
+                started = time.perf_counter()
+                plotter.plot_sheet(dirpath, filename, rawdata, grids)
+                timings['render'] += time.perf_counter() - started
+                if grid_cache is not None:
+                    differences += plotter.compare(grid_cache, dirpath, filename, rawdata, grids, timings)
+        except Exception as e:
+            error = str(e)
+        finally:
+            # 释放对共享内存的引用，主进程才能重新分配缓冲区
+            points = rawdata = grids = grid = None
+            try:
+                plotter.archives.flush()
+            except Exception as e:
+                error = error or str(e)
+        count += 1
+        telemetry = memory_usage()
+        telemetry['tasks'] = count
+        telemetry['artists'] = len(plotter.figure_2d.findobj()) + len(plotter.figure_3d.findobj())
+        # 图片写入时间单独统计，不计入绘图时间
+        timings['render'] = max(timings['render'] - plotter.write_time, 0.0)
+        timings['write'] = plotter.write_time
+        telemetry['timings'] = timings
+        results.put((error, telemetry, differences))
+    if shm is not None:
+        shm.close()
+
+
+class RenderWorker:
+    # 在独立进程中执行绘图，任务数或内存超过上限时回收重启进程，避免长期运行时内存持续增长
+    def __init__(self, config):
+        self.config = config
+        self.context = multiprocessing.get_context("spawn")
+        self.process = None
+        self.tasks = None
+        self.results = None
+        self.buffer = None
+        self.telemetry = {}     # 绘图进程最近一次上报的内存占用
+        self.differences = []   # 最近一次绘图任务得到的前后两次量测差异
+        self.recycled = 0
+        self._config_changed = False
+
+    def update_config(self, config):
+        # 配置变更后，下一个任务前重启绘图进程
+        self.config = config
+        self._config_changed = True
+
+    def start(self):
+        self.tasks = self.context.Queue()
+        self.results = self.context.Queue()
+        self.process = self.context.Process(
+            target=render_worker_main, args=(self.config, self.tasks, self.results), daemon=True)
+        self.process.start()
+        self._config_changed = False
+
+    def stop(self, timeout=5):
+        # 通知绘图进程退出，超时后强制结束
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            self.tasks.put(None)
+            self.process.join(timeout)
+        self.kill()
+
+    def kill(self):
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.process = None
+        self.tasks = self.results = None
+        self.telemetry = {}
+
+    def close(self):
+        self.kill()
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+
+    def render(self, kind, dirpath, filename, rawdata, token):
+        # 提交绘图任务并等待完成，返回错误信息；任务被取消时结束绘图进程，丢弃未完成的任务并抛出 OperationCancelled
+        if self.process is not None and self._config_changed:
+            self.stop()
+        if self.process is None:
+            self.start()
+        if self.buffer is None:
+            self.buffer = SharedPointBuffer()
+        shm_name, slices = self.buffer.write([bga['pos'] for bga in rawdata])
+        items = [({k: v for k, v in bga.items() if k != 'pos'}, start, rows)
+                 for bga, (start, rows) in zip(rawdata, slices)]
+        self.tasks.put((kind, dirpath, filename, shm_name, items))
+        self.differences = []
+
+        # 绘图时间上限按量测位置个数累计，超时后结束绘图进程
+        budget = float(self.config['renderTimeBudget']) * len(rawdata)
+        deadline = time.monotonic() + budget if budget > 0 else None
+        while True:
+            try:
+                error, self.telemetry, self.differences = self.results.get(timeout=0.05)
+                return error
+            except queue.Empty:
+                if token.cancelled:
+                    self.kill()
+                    token.check()
+                if not self.process.is_alive():
+                    self.kill()
+                    return "绘图进程意外退出"
+                if deadline is not None and time.monotonic() > deadline:
+                    self.kill()
+                    return f"绘图超过时间上限 {budget:.0f} 秒，已放弃"
+
+    def recycle_if_needed(self):
+        # 达到任务数上限或常驻内存上限时重启绘图进程，返回重启原因
+        if self.process is None or not self.telemetry:
+            return None
+        reason = None
+        max_tasks = int(self.config['workerMaxTasks'])
+        max_rss = float(self.config['workerMaxRssMB']) * 1024 * 1024
+        if max_tasks > 0 and self.telemetry['tasks'] >= max_tasks:
+            reason = f"已完成 {self.telemetry['tasks']} 个绘图任务"
+        elif max_rss > 0 and self.telemetry['rss'] > max_rss:
+            reason = f"内存占用 {self.telemetry['rss'] / 1048576:.0f} MB 超过上限"
+        if reason:
+            self.stop()
+            self.recycled += 1
+        return reason
+
+
 class FileAnalyzerThread(QThread):
     logging = Signal(str, str)
     showInfoSignal = Signal(str)
@@ -31,9 +1496,25 @@ class FileAnalyzerThread(QThread):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.config = {}
-        self._process_next = False
-        self._stop_event = True
+        self.cancel_token = CancelToken()   # 停止分析时取消，扫描、解析、拟合、绘图各阶段均会检查
+        self.cancel_token.cancel()
+        self._wake = threading.Event()
         self._terminal = False
+        self.result_index = ResultIndex()   # 平整度结果索引，供查询服务使用
+        self.index_queue = queue.Queue()    # 等待加入结果索引的已有结果文件，由后台线程读取
+        self.index_queued = set()
+        self.index_thread = None
+        self.spc_monitor = None             # 平整度统计过程控制，由主窗口根据配置创建
+        self.render_worker = None           # 绘图工作进程，收到配置后创建
+        self.metrics = Metrics()            # 运行指标，供指标服务使用
+        self.leases = None                  # 多工作站任务租约
+        self.layouts = None                 # 平面拟合的量测点布局缓存，收到配置后创建
+        self.events = None                  # 结构化事件日志，收到配置后创建
+        self.timings = {}                   # 当前文件各阶段耗时（秒）
+        self.file_versions = {}             # 未转换的数据文件 -> 版本，每个版本只计入一次发现文件数
+        self.failed_files = {}              # 分析失败的数据文件 -> 失败时的版本，文件修改之前不再重复分析
+        self.retry_files = {}               # 暂时无法读取的数据文件 -> (连续失败次数, 下次重试时间)
+        self.skipped_files = {}             # 跳过的数据文件 -> (版本, 原因)，同一版本相同原因的跳过事件只记录一次
         self.begin_pattern = re.compile(r'^\:BEGIN\s*$')
         self.end_pattern = re.compile(r'^\:END\s*$')
         self.pos_pattern = re.compile(
@@ -46,237 +1527,710 @@ class FileAnalyzerThread(QThread):
 
     def update_config(self, config):
         self.config = config
-
-    def process_next(self):
-        self._process_next = True
+        if self.layouts is None:
+            self.layouts = LayoutCache(float(config['layoutCacheMB']) * 1048576)
+        if self.events is None and config['eventLogFile']:
+            self.events = EventLogger(app_file_path(config['eventLogFile']), float(config['eventLogMaxMB']) * 1048576,
+                                      float(config['eventLogRotateHours']) * 3600, config['eventLogBackups'])
+        if self.render_worker is None:
+            self.render_worker = RenderWorker(config)
+        else:
+            self.render_worker.update_config(config)
 
     def run(self):
+        while not self._terminal:
+            if self.cancel_token.cancelled:
+                # 暂停状态下等待恢复或退出
+                self._wake.wait(1)
+                self._wake.clear()
+                continue
+            scanDirectoryInterval = int(self.config['scanDirectoryInterval'])
+            try:
+                self.scan_directory()
+            except OperationCancelled:
+                continue
+            self.showInfoSignal.emit(f"所有数据分析完成，等待 {scanDirectoryInterval}  秒后重新扫描文件夹。")
+            self.cancel_token.wait(scanDirectoryInterval)
+        if self.render_worker is not None:
+            self.render_worker.close()
+        if self.leases is not None:
+            self.leases.close()
+        if self.events is not None:
+            self.events.close()
+
+    def log_event(self, event, **fields):
+        # 写入结构化事件日志，未启用时忽略
+        if self.events is not None:
+            self.events.emit(event, **fields)
+
+    def observe_stage(self, stage, seconds):
+        # 记录处理阶段耗时：加入运行指标，并累计到当前文件的阶段耗时事件中
+        self.metrics.observe('flatscan_stage_seconds', seconds, stage=stage)
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def get_lease_manager(self):
+        # 启用多工作站协作时返回租约管理器，数据文件夹变更后重新创建
+        if not self.config['multiStation']:
+            if self.leases is not None:
+                self.leases.close()
+                self.leases = None
+            return None
+        lease_dir = self.config['leaseDirectory'] or os.path.join(self.config['dataDirectory'], LEASE_DIRNAME)
+        if self.leases is None or self.leases.lease_dir != lease_dir:
+            if self.leases is not None:
+                self.leases.close()
+            station = self.config['stationName'] or socket.gethostname()
+            self.leases = LeaseManager(lease_dir, station, self.config['leaseTimeout'])
+        return self.leases
+
+    def scan_directory(self):
+        # 扫描数据文件夹并分析所有未转换的数据文件
+        token = self.cancel_token
+        scanner = DirectoryScanner(
+            self.config['filesFilter'], self.config['excludeFilter'] + ";" + LEASE_DIRNAME, self.config['maxScanDepth'],
+            self.config['archiveFilter'])
+        metrics = self.metrics
+        leases = self.get_lease_manager()
+        pending = []
+        versions = {}
+        for dirpath, fullfilename, filename, result_file, converted, entry in scan_inputs(
+                scanner, self.config['dataDirectory'], token):
+            if converted:
+                # 跳过已经转换的txt文件，首次遇到时交给后台线程将已有结果加入索引，不延迟新文件的分析
+                if result_file not in self.index_queued and not self.result_index.has_source(result_file):
+                    self.index_queued.add(result_file)
+                    self.index_queue.put(result_file)
+                    if self.index_thread is None:
+                        self.index_thread = threading.Thread(target=self.load_result_index, name="result-index",
+                                                             daemon=True)
+                        self.index_thread.start()
+                continue
+            file_path = os.path.join(dirpath, fullfilename)
+            try:
+                version = versions[file_path] = file_version(entry.stat())
+            except OSError:
+                continue
+            if self.file_versions.get(file_path) != version:
+                # 新文件或文件已修改
+                metrics.inc('flatscan_files_discovered_total')
+                self.log_event('file_discovered', file=file_path)
+            if self.failed_files.get(file_path) == version:
+                continue
+            if file_path in self.retry_files and time.monotonic() < self.retry_files[file_path][1]:
+                continue
+            pending.append((dirpath, fullfilename, filename, result_file))
+        # 只保留本次扫描中仍未转换的文件，已转换或已删除的文件不再记录
+        self.file_versions = versions
+        self.failed_files = {path: version for path, version in self.failed_files.items() if versions.get(path) == version}
+        self.skipped_files = {path: skipped for path, skipped in self.skipped_files.items()
+                              if versions.get(path) == skipped[0]}
+        self.retry_files = {path: retry for path, retry in self.retry_files.items() if path in versions}
+        metrics.set('flatscan_backlog_files', len(pending))
+
+        for index, (dirpath, fullfilename, filename, result_file) in enumerate(pending):
+            token.check()
+            file_path = os.path.join(dirpath, fullfilename)
+            lease_key = None
+            if leases is not None:
+                # 其它工作站正在分析或已经完成的文件直接跳过
+                lease_key = os.path.relpath(file_path, self.config['dataDirectory']).replace("\\", "/")
+                if not leases.acquire(lease_key):
+                    self.log_skipped(file_path, 'leased')
+                    metrics.set('flatscan_backlog_files', len(pending) - index - 1)
+                    continue
+                if os.path.isfile(result_file):
+                    leases.release(lease_key)
+                    self.log_skipped(file_path, 'converted')
+                    metrics.set('flatscan_backlog_files', len(pending) - index - 1)
+                    continue
+            self.showInfoSignal.emit(f"正在分析文件：{file_path}")
+            self.logging.emit(f"正在分析文件：{file_path}", "INFO")
+            try:
+                if self.analyze_file(dirpath, fullfilename, filename, result_file, lease_key):
+                    metrics.inc('flatscan_files_processed_total')
+                    self.retry_files.pop(file_path, None)
+                else:
+                    metrics.inc('flatscan_files_failed_total')
+                    if lease_key is None or leases.is_held(lease_key):
+                        self.mark_failed(file_path)
+            except OperationCancelled:
+                self.logging.emit(f"已经停止文件 {fullfilename} 的平整度分析！", "ERROR")
+                self.log_event('file_skipped', file=file_path, reason='cancelled')
+                raise
+            except (OSError, zipfile.BadZipFile) as e:
+                # 文件被占用、权限不足、共享断开或压缩包尚未写完等暂时性错误，不标记为失败，稍后重试
+                metrics.inc('flatscan_files_failed_total')
+                self.logging.emit(f"读写文件 {fullfilename} 时出现错误：{e}", "ERROR")
+                self.log_event('file_failed', file=file_path, message=str(e))
+                self.retry_later(file_path)
+            except (ValueError, np.linalg.LinAlgError) as e:
+                # 量测数据本身无法拟合，文件修改之前重新分析结果也相同
+                metrics.inc('flatscan_files_failed_total')
+                self.logging.emit(f"文件 {fullfilename} 分析平整度时出现错误：{e}", "ERROR")
+                self.log_event('file_failed', file=file_path, message=str(e))
+                self.mark_failed(file_path)
+            except Exception as e:
+                metrics.inc('flatscan_files_failed_total')
+                self.logging.emit(f"文件 {fullfilename} 分析平整度时出现错误：{e}", "ERROR")
+                self.log_event('file_failed', file=file_path, message=str(e))
+                self.retry_later(file_path)
+            finally:
+                if self.timings:
+                    self.log_event('stage_timings', file=file_path, stages=self.timings)
+                if lease_key is not None:
+                    leases.release(lease_key)
+                metrics.set('flatscan_backlog_files', len(pending) - index - 1)
+
+    def load_result_index(self):
+        # 后台线程：逐个读取已有结果文件加入结果索引，共享文件夹中大量历史结果也不会阻塞分析
         while True:
-            while not self._stop_event:
-                search_pattern = os.path.join(self.config['dataDirectory'], "**", "*平整度*.txt")
-                scanDirectoryInterval = int(self.config['scanDirectoryInterval'])
-                for file_path in glob.iglob(search_pattern, recursive=True):
-                    if self._stop_event:
-                        break
-                    self.showInfoSignal.emit(f"正在分析文件：{file_path}")
-                    if os.path.isfile(file_path):  # 确保仅处理文件
-                        dirpath = os.path.dirname(file_path)
-                        fullfilename = os.path.basename(file_path)
-                        filename, fileext = os.path.splitext(fullfilename)
-                        
-                        result_file = os.path.join(dirpath, filename + ".csv")
-                        if os.path.isfile(result_file):
-                            # 跳过已经转换的txt文件
-                            continue
-                        
-                        self.logging.emit(f"正在分析文件：{file_path}", "INFO")
-                        rawdata = self.load_txt_file(file_path)  # 读取三次元量测的txt文件
-                        if not rawdata:
-                            self.logging.emit(f"文件 {fullfilename} 中没有找到量测数据！", "ERROR")
-                            continue
-
-                        result = [["文件名", "日期", "时间", "板编号", "量测位置", "中心形貌", "平整度"]]
-                        try:
-                            for bga in rawdata:
-                                if self._stop_event:
-                                    break
-                                bga = self.calcFlatness(bga)    # 计算相对理想平面的Z坐标
-                                result.append([filename, bga['date'], bga['time'], bga['sn'], bga['location'], bga['shape'], bga['flatness']])
-                                self._process_next = False
-                                self.flatnessSignal.emit(dirpath, filename, bga)
-                                while not (self._process_next or self._stop_event):
-                                    self.msleep(50)
-                            if self._stop_event:
-                                self.logging.emit(f"已经停止文件 {fullfilename} 的平整度分析！", "ERROR")
-                                break
-                            with open(result_file, mode='w', newline='', encoding='gb2312') as csvfile:
-                                # 保存平整度数据
-                                writer = csv.writer(csvfile)
-                                writer.writerows(result)
-                                self.logging.emit(f"文件 {fullfilename} 分析完成！", "INFO")
-                        except Exception as e:
-                            self.logging.emit(f"文件 {fullfilename} 分析平整度时出现错误：{e}", "ERROR")
-                self.showInfoSignal.emit(f"所有数据分析完成，等待 {scanDirectoryInterval}  秒后重新扫描文件夹。")
-                for _ in range(scanDirectoryInterval):
-                    self.msleep(1000)
-                    if self._stop_event:
-                        break
-                        
+            result_file = self.index_queue.get()
+            try:
+                self.result_index.load_csv(result_file)
+            except Exception as e:
+                self.logging.emit(f"读取结果文件 {result_file} 时出现错误：{e}", "ERROR")
+            finally:
+                self.index_queued.discard(result_file)
 
-            if self._terminal:
-                break
-            if self._stop_event:
-                self.msleep(1000)
+    def log_skipped(self, file_path, reason):
+        # 其它工作站持有租约的文件每次扫描都会跳过，同一文件版本只记录一次跳过事件
+        skipped = (self.file_versions.get(file_path), reason)
+        if self.skipped_files.get(file_path) != skipped:
+            self.skipped_files[file_path] = skipped
+            self.log_event('file_skipped', file=file_path, reason=reason)
+
+    def mark_failed(self, file_path):
+        # 记录分析失败的文件版本，文件修改之前不再重复分析、计数和报错
+        version = self.file_versions.get(file_path)
+        if version is not None:
+            self.failed_files[file_path] = version
+            self.logging.emit(f"文件 {os.path.basename(file_path)} 修改之前不再重新分析", "WARN")
+
+    def retry_later(self, file_path):
+        # 暂时性错误按扫描间隔加倍退避后重试，最长间隔1小时，分析成功或文件不再需要分析时清除
+        failures = self.retry_files.get(file_path, (0, 0))[0] + 1
+        delay = min(int(self.config['scanDirectoryInterval']) * 2 ** (failures - 1), 3600)
+        self.retry_files[file_path] = (failures, time.monotonic() + delay)
+        if failures > 1:
+            self.logging.emit(f"文件 {os.path.basename(file_path)} 已连续 {failures} 次出现错误，{delay} 秒后重试", "WARN")
+
+    def analyze_file(self, dirpath, fullfilename, filename, result_file, lease_key=None):
+        # 分析单个数据文件：解析、计算平整度、绘图并保存结果，返回是否成功，取消时抛出 OperationCancelled
+        token = self.cancel_token
+        metrics = self.metrics
+        file_path = os.path.join(dirpath, fullfilename)
+        self.timings = {}
+        started = time.perf_counter()
+        rawdata = self.load_txt_file(file_path, token)  # 读取三次元量测的txt文件
+        self.observe_stage('parse', time.perf_counter() - started)
+        if not rawdata:
+            self.logging.emit(f"文件 {fullfilename} 中没有找到量测数据！", "ERROR")
+            self.log_event('file_skipped', file=file_path, reason='no_data')
+            return False
+        self.log_event('file_parsed', file=file_path, bgas=len(rawdata), seconds=self.timings['parse'])
+
+        result = [RESULT_HEADER]
+        differences = []
+        render_mode = self.config['renderMode']    # single：逐个位置绘图，sheet：汇总图，both：两者都输出
+        regional = self.config['regionalGrid'] if self.config['regionalAnalysis'] else None
+        for bga in rawdata:
+            token.check()
+            try:
+                started = time.perf_counter()
+                bga = self.calcFlatness(bga)    # 计算相对理想平面的Z坐标
+                self.observe_stage('fit', time.perf_counter() - started)
+                if regional:
+                    bga['regional'] = self.calcRegional(bga, regional)
+            except Exception as e:
+                self.log_event('error', file=file_path, sn=bga['sn'], location=bga['location'], message=str(e))
+                raise
+            metrics.record_bga()
+            result.append([filename, bga['date'], bga['time'], bga['sn'], bga['location'], bga['shape'], bga['flatness']])
+            self.log_event('bga_result', dirpath=dirpath, file=filename, date=bga['date'], time=bga['time'], sn=bga['sn'],
+                       location=bga['location'], shape=bga['shape'], flatness=bga['flatness'], points=len(bga['pos']))
+            self.flatnessSignal.emit(dirpath, filename, bga)
+            if render_mode != 'sheet':
+                differences += self.render('single', dirpath, filename, [bga])
+        if render_mode != 'single':
+            differences += self.render('sheet', dirpath, filename, rawdata)
+        token.check()
+
+        started = time.perf_counter()
+        temp_file = f"{result_file}.{uuid.uuid4().hex}.tmp"
+        with open(temp_file, mode='w', newline='', encoding='gb2312') as csvfile:
+            # 保存平整度数据，先写入临时文件再替换，其它工作站不会读到不完整的结果文件
+            writer = csv.writer(csvfile)
+            writer.writerows(result)
+        if lease_key is not None and not self.leases.is_held(lease_key):
+            os.remove(temp_file)
+            self.logging.emit(f"文件 {fullfilename} 的任务租约已被其它工作站接管，放弃保存结果！", "WARN")
+            self.log_event('file_skipped', file=file_path, reason='lease_lost')
+            return False
+        os.replace(temp_file, result_file)
+        if regional:
+            self.save_regional(os.path.join(dirpath, self.config['regionalOutputFile'].format(filename=filename)), rawdata)
+        if differences:
+            self.save_differences(os.path.join(dirpath, self.config['differenceResultFile'].format(filename=filename)),
+                                  filename, rawdata, differences)
+        self.observe_stage('write', time.perf_counter() - started)
+        self.result_index.add_rows(result_file, result[1:])
+        self.update_spc(filename, rawdata)
+        self.logging.emit(f"文件 {fullfilename} 分析完成！", "INFO")
+        return True
+
+    def render(self, kind, dirpath, filename, rawdata):
+        # 在绘图工作进程中输出图片，等待期间仍然响应停止操作，返回与前次量测的对比结果
+        # 量测点数超过插值上限时绘图使用抽样后的点，平整度计算仍使用全部量测点
+        max_points = int(self.config['interpolationMaxPoints'])
+        rawdata = [self.decimate(filename, bga, max_points) for bga in rawdata]
+        error = self.render_worker.render(kind, dirpath, filename, rawdata, self.cancel_token)
+        for stage, seconds in self.render_worker.telemetry.get('timings', {}).items():
+            self.observe_stage(stage, seconds)
+        if error:
+            self.logging.emit(f"使用文件 {filename} 中数据进行绘图时出现错误: {error}", "ERROR")
+            self.log_event('error', file=os.path.join(dirpath, filename), sn=rawdata[0]['sn'],
+                       location=rawdata[0]['location'] if kind == 'single' else None, message=error)
+        reason = self.render_worker.recycle_if_needed()
+        if reason:
+            self.logging.emit(f"绘图进程已回收重启：{reason}", "WARN")
+        for item in self.render_worker.differences:
+            self.logging.emit(
+                f"板编号 {item['sn']} 的 {item['location']} 与前次量测（{item['file']} {item['date']} {item['time']}）相比，"
+                f"平整度 {item['flatness']} → {item['flatness'] + item['delta']:.4f}，变化 {item['delta']:+.4f}", "INFO")
+        return self.render_worker.differences
+
+    def calcRegional(self, data, shape):
+        # 将修正后的Z'值按 N×M 网格分区，计算每个分区的平整度、倾斜度和曲率
+        # 分区统计均使用 bincount 向量化计算；点数不足的分区结果为 NaN
+        nx, ny = int(shape[0]), int(shape[1])
+        pos = data['pos']
+        x = pos[:, 0]
+        y = pos[:, 1]
+        z = pos[:, 2]
+        rangeX = max(data['maxX'] - data['minX'], 1e-9)
+        rangeY = max(data['maxY'] - data['minY'], 1e-9)
+        cellX = np.clip(((x - data['minX']) / rangeX * nx).astype(np.int64), 0, nx - 1)
+        cellY = np.clip(((y - data['minY']) / rangeY * ny).astype(np.int64), 0, ny - 1)
+        cell = cellX * ny + cellY
+        size = nx * ny
+
+        # 各分区的Z'最大、最小值
+        order = np.argsort(cell, kind='stable')
+        sortedCell = cell[order]
+        starts = np.flatnonzero(np.r_[True, sortedCell[1:] != sortedCell[:-1]])
+        cells = sortedCell[starts]
+        zmin = np.full(size, np.nan)
+        zmax = np.full(size, np.nan)
+        zmin[cells] = np.minimum.reduceat(z[order], starts)
+        zmax[cells] = np.maximum.reduceat(z[order], starts)
+
+        # 各分区拟合平面 z = a·x + b·y + c，倾斜度为 sqrt(a² + b²)
+        count = np.bincount(cell, minlength=size).astype(np.float64)
+        dx = x - x.mean()
+        dy = y - y.mean()
+        sums = [np.bincount(cell, weights=w, minlength=size)
+                for w in (dx, dy, z, dx * dx, dy * dy, dx * dy, dx * z, dy * z)]
+        sx, sy, sz, sxx, syy, sxy, sxz, syz = sums
+        normal = np.stack([
+            np.stack([sxx, sxy, sx], axis=-1),
+            np.stack([sxy, syy, sy], axis=-1),
+            np.stack([sx, sy, count], axis=-1)], axis=-2)
+        rhs = np.stack([sxz, syz, sz], axis=-1)
+        solvable = (count >= 3) & (np.abs(np.linalg.det(normal)) > 1e-12)
+        slope = np.full(size, np.nan)
+        if solvable.any():
+            coeff = np.linalg.solve(normal[solvable], rhs[solvable][..., None])[..., 0]
+            slope[solvable] = np.hypot(coeff[:, 0], coeff[:, 1])
+
+        # 曲率为分区平均Z'的拉普拉斯算子（二阶差分之和），分区间距为实际尺寸
+        mean = np.where(count > 0, sz / np.maximum(count, 1), np.nan).reshape(nx, ny)
+        curvature = np.full((nx, ny), np.nan)
+        if nx >= 3 and ny >= 3:
+            stepX = rangeX / nx
+            stepY = rangeY / ny
+            curvature[1:-1, 1:-1] = (
+                (mean[2:, 1:-1] - 2 * mean[1:-1, 1:-1] + mean[:-2, 1:-1]) / stepX ** 2 +
+                (mean[1:-1, 2:] - 2 * mean[1:-1, 1:-1] + mean[1:-1, :-2]) / stepY ** 2)
+
+        return {
+            'flatness': (zmax - zmin).reshape(nx, ny),
+            'slope': slope.reshape(nx, ny),
+            'curvature': curvature,
+            'mean': mean,
+            'count': count.reshape(nx, ny),
+        }
+
+    def save_regional(self, path, rawdata):
+        # 分区结果按结果文件中的行顺序保存为压缩的 .npz 文件，数值使用 float32 存储
+        fields = ('flatness', 'slope', 'curvature', 'mean', 'count')
+        arrays = {field: np.stack([bga['regional'][field] for bga in rawdata]).astype(np.float32)
+                  for field in fields}
+        arrays['sn'] = np.array([bga['sn'] for bga in rawdata])
+        arrays['location'] = np.array([bga['location'] for bga in rawdata])
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+
+    def save_differences(self, path, filename, rawdata, differences):
+        # 保存前后两次量测的平整度变化，每个量测位置取最后一次对比结果
+        flatness = {(bga['sn'], bga['location']): bga['flatness'] for bga in rawdata}
+        rows = {}
+        for item in differences:
+            key = (item['sn'], item['location'])
+            rows[key] = [filename, item['sn'], item['location'], item['file'], item['date'], item['time'],
+                         item['flatness'], flatness[key], item['delta']]
+        with open(path, mode='w', newline='', encoding='gb2312') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(DIFFERENCE_HEADER)
+            writer.writerows(rows.values())
+
+    def decimate(self, filename, bga, max_points):
+        pos = decimate_points(bga['pos'], max_points)
+        if len(pos) == len(bga['pos']):
+            return bga
+        self.logging.emit(
+            f"文件 {filename} 中编号 {bga['sn']} 的 {bga['location']} 共 {len(bga['pos'])} 个量测点，"
+            f"超过插值上限 {max_points}，绘图时均匀抽样为 {len(pos)} 个点", "WARN")
+        return dict(bga, pos=pos)
+
+    def update_spc(self, filename, rawdata):
+        # 将文件中所有平整度结果加入统计过程控制，超出控制限时报警
+        if self.spc_monitor is None:
+            return
+        product = re.sub(self.config['filenameReplPattern'], self.config['filenameReplResult'], filename)
+        for bga in rawdata:
+            for alarm in self.spc_monitor.update(product, bga['location'], bga['flatness']):
+                self.logging.emit(f"SPC报警：板编号 {bga['sn']} {alarm}", "ERROR")
+        try:
+            self.spc_monitor.save()
+        except OSError as e:
+            self.logging.emit(f"保存SPC统计数据失败：{e}", "ERROR")
 
     def resume(self):
-        self._stop_event = False
+        self.cancel_token.reset()
+        self._wake.set()
 
     def stop(self):
-        self._stop_event = True
+        self.cancel_token.cancel()
 
     def terminate(self):
         self._terminal = True
-        self._stop_event = True
+        self.cancel_token.cancel()
+        self._wake.set()
 
-    def load_txt_file(self, file_path):
-        # 导入三次元测量数据 .txt 文件，将所有单元的数据存储在数组中
-        flag = False
+    @staticmethod
+    def detect_encoding(file_path, token=None, chunk_size=65536, sample_size=262144):
+        # 分块识别文件编码，每块之间检查是否已取消，识别结果确定或已读取 sample_size 字节后不再继续读取
+        # 纯 ASCII 的行对识别编码没有帮助，只将包含非 ASCII 字符的行交给 chardet，点表格等以数字为主的文件可以很快完成识别
+        detector = UniversalDetector()
+        fed = False
+        with open_input(file_path) as f:
+            remaining = sample_size if sample_size > 0 else math.inf
+            while remaining > 0:
+                chunk = f.read(int(min(chunk_size, remaining)))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                if token is not None:
+                    token.check()
+                if chunk.isascii():
+                    continue
+                detector.feed(b"\n".join(line for line in chunk.split(b"\n") if not line.isascii()))
+                fed = True
+                if detector.done:
+                    break
+        if not fed:
+            return 'utf-8'
+        detector.close()
+        return detector.result['encoding']
+
+    def load_txt_file(self, file_path, token=None, encoding=None):
+        # 导入三次元测量数据文件（可以是压缩文件或 ZIP 压缩包中的文件），根据文件开头的内容识别格式后调用对应的解析方法
+        # 未指定编码时自动识别；文件无法读取（被占用、权限不足、共享断开等）时抛出 OSError，由调用方稍后重试
         result = []
-        unit = []
         try:
-            with open(file_path, mode='rb') as f:
-                encoding = chardet.detect(f.read())['encoding']
-            with open(file_path, mode='r', encoding=encoding, errors='ignore') as f:
+            if not encoding:
+                encoding = self.detect_encoding(file_path, token, sample_size=int(self.config['encodingSampleSize']))
+            with open_input(file_path) as raw, io.TextIOWrapper(raw, encoding=encoding, errors='ignore') as f:
+                # 读取到第一个非空行用于识别格式，之后与剩余内容一起交给解析方法
+                head = []
                 for line in f:
-                    if self.begin_pattern.match(line):
-                        # 识别三次元数据起始标记
-                        flag = True
-                        unit = []
-                        bga = {
-                            'sn': '',
-                            'location': '',
-                            'date': '',
-                            'time': '',
-                            'minX': None,
-                            'maxX': None,
-                            'minY': None,
-                            'maxY': None,
-                            'flatness': None,
-                            'shape': '未知',
-                            'pos': []
-                        }
-                        continue
-
-                    if not flag:
-                        # 未识别到三次元数据起始标记时忽略
-                        continue
-
-                    if self.end_pattern.match(line):
-                        # 识别三次元数据结束标记
-                        flag = False
-                        
-                        for bga in unit:
-                            if self.config['locationFilter'].upper() in bga['location'].upper():
-                                if bga['sn'] and bga['location']:
-                                    if len(bga['pos']) > 2:
-                                        result.append(bga)
-                                    else:
-                                        self.logging.emit(f"文件 {file_path} 中编号 {bga['sn']} 的 {bga['location']} 数据量测点数不足3个，已忽略！", "ERROR")
-                                        
-                                    
-
-                    elif self.location_pattern.match(line):
-                        # 识别测量位置
-                        bga['location'] = line.strip()
-                        unit.append(bga)
-                        bga = {
-                            'sn': '',
-                            'location': '',
-                            'date': '',
-                            'time': '',
-                            'minX': None,
-                            'maxX': None,
-                            'minY': None,
-                            'maxY': None,
-                            'flatness': None,
-                            'shape': '未知',
-                            'pos': []
-                        }
-
-                    elif self.pos_pattern.match(line):
-                        # 识别测量数据
-                        pos = self.pos_pattern.match(line).groups()
-                        x = float(pos[0])
-                        y = float(pos[1])
-                        z = float(pos[2])
-                        if bga['minX'] is None or x < bga['minX']:
-                            bga['minX'] = x
-                        if bga['maxX'] is None or x > bga['maxX']:
-                            bga['maxX'] = x
-                        if bga['minY'] is None or y < bga['minY']:
-                            bga['minY'] = y
-                        if bga['maxY'] is None or y > bga['maxY']:
-                            bga['maxY'] = y
-                        bga['pos'].append([x, y, z])
-
-                    elif self.sn_pattern1.match(line):
-                        # 识别测量编号，示使如下：
-                        # 文字说明 75: 文字说明  文字说明 75: 日期/时间 2025-02-24 18:50:25 9206301-02
-                        date, time, sn = self.sn_pattern1.match(line).groups()
-                        for bga in unit:
-                            bga['sn'] = sn
-                            bga['date'] = date
-                            bga['time'] = time
-
-                    elif self.sn_pattern2.match(line):
-                        # 识别测量编号，示例如下：
-                        # 提示 44: 提示  提示 44: 输入 42363-03 提示 44: 日期/时间 2025-02-19 13:05:27
-                        sn, date, time = self.sn_pattern2.match(line).groups()
-                        for bga in unit:
-                            bga['sn'] = sn
-                            bga['date'] = date
-                            bga['time'] = time
+                    head.append(line)
+                    if line.strip():
+                        break
+                input_format = self.config['inputFormat']
+                if input_format == 'auto':
+                    sample = "".join(head)
+                    input_format = next(name for name, (sniff, _) in INPUT_FORMATS.items() if sniff(sample))
+                if input_format not in INPUT_FORMATS:
+                    raise ValueError(f"不支持的数据文件格式 {input_format}")
+                parser = getattr(self, INPUT_FORMATS[input_format][1])
+                units = parser(head, f, token)
+        except (OperationCancelled, OSError, zipfile.BadZipFile):
+            raise
         except Exception as e:
             self.logging.emit(f"数据文件 {file_path} 解析失败：{e}", "ERROR")
+            self.log_event('error', file=file_path, message=f"解析失败：{e}")
+            return result
+
+        for bga in units:
+            if self.config['locationFilter'].upper() in bga['location'].upper():
+                if bga['sn'] and bga['location']:
+                    if len(bga['pos']) > 2:
+                        self.pack_points(bga)
+                        result.append(bga)
+                    else:
+                        self.logging.emit(f"文件 {file_path} 中编号 {bga['sn']} 的 {bga['location']} 数据量测点数不足3个，已忽略！", "ERROR")
+                        self.log_event('error', file=file_path, sn=bga['sn'], location=bga['location'],
+                                   message="量测点数不足3个")
+        return result
+
+    def parse_report(self, head, f, token=None):
+        # 解析中文三次元测量报告文本，逐行匹配正则表达式，返回所有单元中的量测位置数据
+        flag = False
+        result = []
+        unit = []
+        for line_no, line in enumerate(itertools.chain(head, f)):
+            if token is not None and line_no % 4096 == 0:
+                token.check()
+            if self.begin_pattern.match(line):
+                # 识别三次元数据起始标记
+                flag = True
+                unit = []
+                bga = {
+                    'sn': '',
+                    'location': '',
+                    'date': '',
+                    'time': '',
+                    'minX': None,
+                    'maxX': None,
+                    'minY': None,
+                    'maxY': None,
+                    'flatness': None,
+                    'shape': '未知',
+                    'pos': []
+                }
+                continue
+
+            if not flag:
+                # 未识别到三次元数据起始标记时忽略
+                continue
+
+            if self.end_pattern.match(line):
+                # 识别三次元数据结束标记
+                flag = False
+                result.extend(unit)
+
+            elif self.location_pattern.match(line):
+                # 识别测量位置
+                bga['location'] = line.strip()
+                unit.append(bga)
+                bga = {
+                    'sn': '',
+                    'location': '',
+                    'date': '',
+                    'time': '',
+                    'minX': None,
+                    'maxX': None,
+                    'minY': None,
+                    'maxY': None,
+                    'flatness': None,
+                    'shape': '未知',
+                    'pos': []
+                }
+
+            elif self.pos_pattern.match(line):
+                # 识别测量数据，坐标文本在单元结束时统一转换为数组
+                bga['pos'].append(self.pos_pattern.match(line).groups())
+
+            elif self.sn_pattern1.match(line):
+                # 识别测量编号，示使如下：
+                # 文字说明 75: 文字说明  文字说明 75: 日期/时间 2025-02-24 18:50:25 9206301-02
+                date, time, sn = self.sn_pattern1.match(line).groups()
+                for bga in unit:
+                    bga['sn'] = sn
+                    bga['date'] = date
+                    bga['time'] = time
+
+            elif self.sn_pattern2.match(line):
+                # 识别测量编号，示例如下：
+                # 提示 44: 提示  提示 44: 输入 42363-03 提示 44: 日期/时间 2025-02-19 13:05:27
+                sn, date, time = self.sn_pattern2.match(line).groups()
+                for bga in unit:
+                    bga['sn'] = sn
+                    bga['date'] = date
+                    bga['time'] = time
+        return result
+
+    def parse_point_table(self, head, f, token=None):
+        # 解析CSV或固定列宽的点表格：表头之后的数据按 4MB 分块读取，整块转换为结构化数组，再按 (板编号, 量测位置) 分组
+        header = first_line(head[-1])
+        delimiter = point_table_delimiter(header)
+        columns = point_table_header(header, delimiter)
+        if columns is None:
+            raise ValueError("点表格缺少板编号、量测位置或X、Y、Z坐标列")
+        fields = list(columns)
+        usecols = [columns[field] for field in fields]
+        chunks = []
+        while True:
+            if token is not None:
+                token.check()
+            block = f.read(1 << 22)
+            if not block:
+                break
+            block = (block + f.readline()).splitlines()
+            if delimiter is None:
+                chunks.append(self.parse_fixed_columns(header, block, fields, usecols))
+            else:
+                chunks.append(self.load_point_rows(block, fields, usecols, delimiter))
+        if not chunks:
+            return []
+        # 各块文本列的宽度可能不同，统一为最大宽度后合并
+        dtype = [(field, 'f8' if field in ('x', 'y', 'z') else max(chunk.dtype[field] for chunk in chunks))
+                 for field in fields]
+        table = np.concatenate([chunk.astype(dtype) for chunk in chunks])
+
+        # 按 (板编号, 量测位置) 分组，各组按在文件中首次出现的顺序排列
+        sn_count, sn_codes = self.column_codes(table['sn'])
+        _, location_codes = self.column_codes(table['location'])
+        _, first, inverse = np.unique(location_codes * sn_count + sn_codes, return_index=True, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.cumsum(np.bincount(inverse))[:-1]
+        groups = np.split(np.column_stack([table['x'], table['y'], table['z']])[order], bounds)
+        result = []
+        for group in np.argsort(first):
+            row = table[first[group]]
+            result.append({
+                'sn': str(row['sn']).strip(),
+                'location': str(row['location']).strip(),
+                'date': str(row['date']).strip() if 'date' in columns else '',
+                'time': str(row['time']).strip() if 'time' in columns else '',
+                'minX': None,
+                'maxX': None,
+                'minY': None,
+                'maxY': None,
+                'flatness': None,
+                'shape': '未知',
+                'pos': groups[group]
+            })
         return result
 
+    @staticmethod
+    def load_point_rows(lines, fields, usecols, delimiter):
+        # 使用 np.loadtxt 按分隔符（None 为空白字符）读取点表格的数据行
+        # 文本列先按 32 个字符读取，有值达到该长度时可能已被截断，加宽后重新读取，避免不同的值截断后被合并为一组
+        width = 32
+        while True:
+            dtype = [(field, 'f8' if field in ('x', 'y', 'z') else f'U{width}') for field in fields]
+            table = np.loadtxt(lines, dtype=dtype, delimiter=delimiter, usecols=usecols,
+                               quotechar='"' if delimiter else None, ndmin=1)
+            if all(np.char.str_len(table[field]).max(initial=0) < width for field in fields if field not in ('x', 'y', 'z')):
+                return table
+            width *= 4
+
+    @staticmethod
+    def parse_fixed_columns(header, block, fields, usecols):
+        # 将一块固定列宽的文本行（连同表头）转换为字符矩阵，所有行在该位置都是空格的字符列为列之间的间隔，
+        # 左对齐、右对齐或比列名更宽的值都能正确切分；按列切片后整列转换类型，不逐行拆分字符串
+        lines = [line for line in block if line.strip()]
+        if not lines:
+            return np.empty(0, dtype=[(field, 'f8' if field in ('x', 'y', 'z') else 'U1') for field in fields])
+        chars = np.array([header] + lines)
+        chars = chars.view(np.uint32).reshape(len(chars), -1)
+        occupied = ((chars != ord(' ')) & (chars != 0)).any(axis=0)    # 0 为较短行末尾的填充
+        edges = np.flatnonzero(np.diff(np.r_[0, occupied, 0].astype(np.int8)))
+        runs = list(zip(edges[::2], edges[1::2]))
+        # 表头中的每个列名都位于某个区段内，区段与列名一一对应时直接使用区段作为列的范围
+        labels = [m.start() for m in re.finditer(r'\S+', header)]
+        owners = np.searchsorted(edges[::2], labels, side='right') - 1
+        spans = [runs[owner] for owner in owners]
+        if len(set(owners)) != len(owners):
+            # 多个列名位于同一区段：列之间没有对齐的空白（只用空格分隔各值）时按空白字符拆分，
+            # 仍不能读取时为相邻的列之间没有空格，在区段内按列名的起始位置切分（左对齐）
+            try:
+                return FileAnalyzerThread.load_point_rows(lines, fields, usecols, None)
+            except ValueError:
+                pass
+            for index, owner in enumerate(owners):
+                start, end = runs[owner]
+                if index > 0 and owners[index - 1] == owner:
+                    start = labels[index]
+                if index + 1 < len(owners) and owners[index + 1] == owner:
+                    end = labels[index + 1]
+                spans[index] = (start, end)
+        columns = []
+        for field, index in zip(fields, usecols):
+            start, end = spans[index]
+            column = np.ascontiguousarray(chars[1:, start:end]).view(f'U{end - start}').reshape(-1)
+            columns.append(column.astype(np.float64) if field in ('x', 'y', 'z') else np.char.strip(column))
+        table = np.empty(len(lines), dtype=[(field, column.dtype) for field, column in zip(fields, columns)])
+        for field, column in zip(fields, columns):
+            table[field] = column
+        return table
+
+    @staticmethod
+    def column_codes(column):
+        # 将文本列转换为整数编号，返回 (不同值的个数, 编号数组)
+        # 同一量测位置的点在文件中通常是连续的，先合并相邻的相同值，只对每段的值排序
+        starts = np.r_[0, np.flatnonzero(column[1:] != column[:-1]) + 1]
+        values, codes = np.unique(column[starts], return_inverse=True)
+        return len(values), np.repeat(codes, np.diff(np.r_[starts, len(column)]))
+
+    @staticmethod
+    def pack_points(bga):
+        # 将量测点转换为连续存储的 N×3 NumPy 数组，之后的计算和绘图都直接使用该数组，不再复制
+        pos = np.array(bga['pos'], dtype=np.float64)
+        bga['pos'] = pos
+        bga['minX'], bga['minY'] = (float(v) for v in pos[:, :2].min(axis=0))
+        bga['maxX'], bga['maxY'] = (float(v) for v in pos[:, :2].max(axis=0))
+        return bga
+
+    def plane_fit_layout(self, data, force=False):
+        # 与Z无关的平面拟合伪逆矩阵 inv(AᵀA)Aᵀ 及中心区域掩码，相同的量测点布局从缓存中读取
+        pos = data['pos']
+        centralZoneLimit = self.config['centralZoneLimit']
+
+        def build():
+            matrixA = np.column_stack((pos[:, 0], pos[:, 1], np.ones(len(pos))))
+            rangeX = data['maxX'] - data['minX']
+            rangeY = data['maxY'] - data['minY']
+            return {
+                'pinv': np.dot(np.linalg.inv(np.dot(matrixA.T, matrixA)), matrixA.T),
+                'central': ((np.abs(2 * (pos[:, 0] - data['minX']) / rangeX - 1) < centralZoneLimit) &
+                            (np.abs(2 * (pos[:, 1] - data['minY']) / rangeY - 1) < centralZoneLimit)),
+            }
+
+        layout = None
+        if self.layouts is not None:
+            layout = self.layouts.get(LayoutCache.key(pos, 'plane', centralZoneLimit), build, force, len(pos) * 25)
+        return layout if layout is not None else build()
+
     def calcFlatness(self, data):
         # 计算理想参考平面的系数
-        matrixA = np.array([[v[0], v[1], 1] for v in data['pos']])
-        matrixB = np.array([[v[2]] for v in data['pos']])
-        matrixCoeff = np.dot(np.dot(np.linalg.inv(
-            np.dot(matrixA.T, matrixA)), matrixA.T), matrixB)
-        coeffA = -1 * matrixCoeff[0][0]
-        coeffB = -1 * matrixCoeff[1][0]
+        pos = data['pos']
+        layout = self.plane_fit_layout(data)
+        matrixCoeff = np.dot(layout['pinv'], pos[:, 2])
+        coeffA = -1 * matrixCoeff[0]
+        coeffB = -1 * matrixCoeff[1]
         coeffC = 1
-        coeffD = -1 * matrixCoeff[2][0]
+        coeffD = -1 * matrixCoeff[2]
         constant = math.sqrt(coeffA * coeffA + coeffB * coeffB + coeffC * coeffC)
 
-        # 计算每个点参考理想平面的高度
-        for point in data['pos']:
-            point[2] = (coeffA * point[0] + coeffB * point[1] +
-                        coeffC * point[2] + coeffD) / constant
+        # 计算每个点参考理想平面的高度，结果直接写回数组的Z列
+        pos[:, 2] = (coeffA * pos[:, 0] + coeffB * pos[:, 1] +
+                     coeffC * pos[:, 2] + coeffD) / constant
+        z = pos[:, 2]
 
-        # 计算中心形貌统计值
-        centralZoneLimit = self.config['centralZoneLimit']
-        centralMinZ = None      # 中心区域最小Z值
-        centralMaxZ = None      # 中心区域最大Z值
-        marginalSumZ = 0         # 边区域Z'总和
-        marginalCount = 0       # 边区域Z'个数
-        minZ = None
-        maxZ = None
-
-        # 迭代计算最小、最大、加总、平均Z值
-        for point in data['pos']:
-            # 计算总体Z'的统计值
-            if minZ is None or point[2] < minZ:
-                minZ = point[2]
-            if maxZ is None or point[2] > maxZ:
-                maxZ = point[2]
-
-            # 计算中心区域Z'统计值
-            minX = data['minX']
-            maxX = data['maxX']
-            minY = data['minY']
-            maxY = data['maxY']
-            rangeX = maxX - minX
-            rangeY = maxY - minY
-
-            if abs(2 * (point[0] - minX) / rangeX - 1) < centralZoneLimit and abs(2 * (point[1] - minY) / rangeY - 1) < centralZoneLimit:
-                # 当前量测点为板中心位置时
-                if centralMinZ is None or point[2] < centralMinZ:
-                    centralMinZ = point[2]
-                if centralMaxZ is None or point[2] > centralMaxZ:
-                    centralMaxZ = point[2]
-            else:
-                # 当前量测点为板边位置时
-                marginalSumZ += point[2]
-                marginalCount += 1
+        # 区分板中心区域与板边区域的量测点
+        central = layout['central']
+        if central.all():
+            raise ValueError(f"{data['location']} 板边区域没有量测点")
 
         # 计算中心区域形貌
-        marginalAvg = marginalSumZ / marginalCount
+        marginalAvg = z[~central].mean()
         data['shape'] = '未知'
-        if centralMinZ is not None:
+        if central.any():
+            centralMinZ = z[central].min()      # 中心区域最小Z值
+            centralMaxZ = z[central].max()      # 中心区域最大Z值
             if centralMinZ > marginalAvg:
                 # 中心凸起
                 data['shape'] = '中心凸起'
@@ -287,9 +2241,712 @@ class FileAnalyzerThread(QThread):
                 # 凹凸不平
                 data['shape'] = '凹凸不平'
 
-        data['flatness'] = round(maxZ - minZ, 4)
+        data['flatness'] = round(float(z.max() - z.min()), 4)
         return data
 
+    def calcFlatnessGroup(self, group):
+        # 批量计算量测点布局相同的多个量测位置：各位置的Z值组成 位置数×点数 的矩阵，
+        # 乘以伪逆矩阵一次得到所有参考平面的系数，Z'投影、平整度和形貌也按矩阵整体计算
+        if len(group) == 1:
+            return [self.calcFlatness(group[0])]
+        layout = self.plane_fit_layout(group[0], force=True)
+        x = group[0]['pos'][:, 0]
+        y = group[0]['pos'][:, 1]
+        matrixZ = np.stack([data['pos'][:, 2] for data in group])
+        matrixCoeff = np.dot(matrixZ, layout['pinv'].T)     # 每行为 (a, b, c)，参考平面 z = ax + by + c
+        constant = np.sqrt(matrixCoeff[:, 0] ** 2 + matrixCoeff[:, 1] ** 2 + 1)
+        matrixZ -= np.outer(matrixCoeff[:, 0], x) + np.outer(matrixCoeff[:, 1], y) + matrixCoeff[:, 2:3]
+        matrixZ /= constant[:, np.newaxis]
+
+        central = layout['central']
+        if central.all():
+            raise ValueError(f"{group[0]['location']} 板边区域没有量测点")
+        marginalAvg = matrixZ[:, ~central].mean(axis=1)
+        shapes = np.full(len(group), '未知', dtype=object)
+        if central.any():
+            centralMinZ = matrixZ[:, central].min(axis=1)
+            centralMaxZ = matrixZ[:, central].max(axis=1)
+            shapes[:] = '凹凸不平'
+            shapes[centralMaxZ < marginalAvg] = '中心下凹'
+            shapes[centralMinZ > marginalAvg] = '中心凸起'
+        flatness = matrixZ.max(axis=1) - matrixZ.min(axis=1)
+
+        # 结果写回各量测位置的Z列，与逐个计算时相同
+        for data, z, shape, value in zip(group, matrixZ, shapes, flatness):
+            data['pos'][:, 2] = z
+            data['shape'] = shape
+            data['flatness'] = round(float(value), 4)
+        return group
+
+
+@contextlib.contextmanager
+def file_lock(path, timeout=60):
+    # 跨进程、跨工作站的排它文件锁，直接锁定要保护的文件本身，不另外生成锁文件，文件不存在时创建空文件
+    # Windows 的字节范围锁会阻止其它句柄读写被锁定的字节，因此锁定远超文件末尾的一个字节，不影响读写文件内容；
+    # 其它系统使用 flock 锁定整个文件；进程退出（包括被强制结束）时锁由系统自动释放
+    fd = os.open(path, os.O_RDWR | os.O_CREAT)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if os.name == 'nt':
+                    os.lseek(fd, FILE_LOCK_OFFSET, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                else:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"等待文件锁 {path} 超时")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if os.name == 'nt':
+                os.lseek(fd, FILE_LOCK_OFFSET, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+class ImageArchive:
+    # 图片归档：将图片以不压缩（ZIP_STORED）方式追加到 ZIP 文件中，减少共享文件夹中的小文件数量
+    # 同一归档中出现同名图片时，读取时以最后追加的为准
+    # 绘图过程中图片只保存在内存中，flush 时锁定归档文件后一次性追加（多个工作站可以共用同一个归档）；
+    # 追加会覆盖原来的文件目录，追加前先把原文件目录及其位置保存到 .journal 文件，
+    # 写入中途进程被结束时，下次访问归档前用 .journal 把归档恢复到追加前的状态
+    def __init__(self):
+        self._pending = collections.OrderedDict()  # 归档文件路径 -> [(图片名称, 图片数据)]
+
+    def append(self, archive_path, name, data):
+        self._pending.setdefault(archive_path, []).append((name, data))
+
+    def flush(self):
+        # 将缓存的图片写入各归档文件
+        pending, self._pending = self._pending, collections.OrderedDict()
+        for archive_path, images in pending.items():
+            with file_lock(archive_path):
+                self.recover(archive_path)
+                self._append(archive_path, images)
+
+    @staticmethod
+    def _append(archive_path, images):
+        journal = archive_path + ".journal"
+        offset, directory = 0, b""
+        if os.path.getsize(archive_path):
+            # 已损坏的归档不再追加，避免 'a' 模式在文件末尾另起一个只包含新图片的归档
+            with zipfile.ZipFile(archive_path) as archive:
+                offset = archive.start_dir
+            with open(archive_path, 'rb') as f:
+                f.seek(offset)
+                directory = f.read()
+        temp = f"{journal}.{uuid.uuid4().hex}.tmp"
+        with open(temp, 'wb') as f:
+            f.write(offset.to_bytes(8, 'little') + directory)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, journal)
+        with zipfile.ZipFile(archive_path, mode='a', compression=zipfile.ZIP_STORED) as archive:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)    # 忽略同名图片的警告
+                for name, data in images:
+                    archive.writestr(name, data)
+        os.remove(journal)
+
+    @staticmethod
+    def recover(archive_path):
+        # 存在 .journal 文件说明上次追加没有完成：截断到原文件目录的位置并写回原文件目录，新建的归档清空
+        # 调用时归档文件已被锁定，不能删除
+        journal = archive_path + ".journal"
+        if not os.path.isfile(journal):
+            return False
+        with open(journal, 'rb') as f:
+            offset = int.from_bytes(f.read(8), 'little')
+            directory = f.read()
+        with open(archive_path, 'r+b') as f:
+            f.truncate(offset)
+            f.seek(offset)
+            f.write(directory)
+        os.remove(journal)
+        return True
+
+    @staticmethod
+    @contextlib.contextmanager
+    def open(archive_path):
+        # 以只读方式打开归档，读取前先恢复未完成的追加；空文件是第一次追加尚未写入的新归档，按空归档处理
+        if os.path.isfile(archive_path + ".journal"):
+            with file_lock(archive_path):
+                ImageArchive.recover(archive_path)
+        if not os.path.getsize(archive_path):
+            with zipfile.ZipFile(io.BytesIO(), mode='w') as archive:
+                yield archive
+            return
+        with zipfile.ZipFile(archive_path) as archive:
+            yield archive
+
+    @staticmethod
+    def list(archive_path):
+        # 返回归档中的图片名称（去除重复）
+        with ImageArchive.open(archive_path) as archive:
+            return list(dict.fromkeys(archive.namelist()))
+
+    @staticmethod
+    def read(archive_path, name):
+        # 读取归档中的单个图片，只需读取文件目录和该图片的数据
+        with ImageArchive.open(archive_path) as archive:
+            return archive.read(archive.getinfo(name))
+
+
+class GridCache:
+    # 插值网格缓存：按 (板编号, 量测位置) 保存最近一次量测的Z'插值网格，用于前后两次量测的对比
+    # 内存中按最近使用保留 max_entries 个，同时以 .npz 文件保存在缓存文件夹中，超过 max_days 天的缓存文件启动时删除
+    def __init__(self, directory, max_entries=256, max_days=7):
+        self.directory = directory
+        self.max_entries = int(max_entries)
+        self._entries = collections.OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+        if max_days > 0:
+            expire = time.time() - float(max_days) * 86400
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".npz") and entry.stat().st_mtime < expire:
+                        try:
+                            os.remove(entry.path)
+                        except OSError:
+                            pass
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha1("\t".join(key).encode("utf-8")).hexdigest() + ".npz")
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        try:
+            with np.load(self.path(key)) as f:
+                entry = {name: f[name] for name in f.files}
+        except (OSError, ValueError):
+            return None
+        for name in ('source', 'filename', 'date', 'time'):
+            entry[name] = str(entry[name])
+        entry['flatness'] = float(entry['flatness'])
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        self._remember(key, entry)
+        temp_file = f"{self.path(key)}.{os.getpid()}.tmp"
+        try:
+            with open(temp_file, 'wb') as f:
+                np.savez(f, **entry)
+            os.replace(temp_file, self.path(key))
+        except OSError:
+            # 缓存文件写入失败时只保留内存中的缓存
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class FlatnessPlotter:
+    # 平整度绘图：插值计算曲面，输出二维等高线图、三维曲面图以及多位置汇总图
+    GROUP_CHUNK = 256       # 批量插值时每次合并计算的位置数，网格矩阵的内存占用与其成正比
+    def __init__(self, config):
+        self.config = config
+        self.archives = ImageArchive()
+        self.layouts = LayoutCache(float(config['layoutCacheMB']) * 1048576)   # 插值计算矩阵的量测点布局缓存
+        self.write_time = 0.0   # 累计图片写入时间（秒）
+        self.figure_3d = Figure()
+        self.figure_2d = Figure()
+        self._lut = None        # 快速二维绘图使用的颜色查找表
+        self._fonts = {}
+        FigureCanvasAgg(self.figure_3d)
+        FigureCanvasAgg(self.figure_2d)
+
+    def output_name(self, filename):
+        # 输出图片使用的文件名
+        return re.sub(self.config['filenameReplPattern'], self.config['filenameReplResult'], filename)
+
+    def get_axes_limit(self, serialx, serialy):
+        # 根据X、Y坐标数据计算图表坐标轴显示范围
+        xmin = np.min(serialx)
+        xmax = np.max(serialx)
+        xavg = (xmin + xmax) / 2
+        ymin = np.min(serialy)
+        ymax = np.max(serialy)
+        yavg = (ymin + ymax) / 2
+        xrange = xmax - xmin
+        yrange = ymax - ymin
+        if xrange > yrange:
+            half_range = xrange / 2
+            return xmin, xmax, yavg - half_range, yavg + half_range
+        else:
+            half_range = yrange / 2
+            return xavg - half_range, xavg + half_range, ymin, ymax
+
+    def get_grid_shape(self, serialx, serialy, pixels, max_size):
+        # 根据量测点密度、长宽比和输出图片像素数确定插值网格的行列数
+        min_size = min(int(self.config["gridMinSize"]), int(max_size))
+        rangeX = float(np.ptp(serialx))
+        rangeY = float(np.ptp(serialy))
+        aspect = rangeX / rangeY if rangeX > 0 and rangeY > 0 else 1.0
+
+        # 按每个量测点间距细分 gridPointsFactor 个网格估计所需网格数，长宽方向按比例分配
+        density = math.sqrt(len(serialx)) * float(self.config["gridPointsFactor"])
+        nx = density * math.sqrt(aspect)
+        ny = density / math.sqrt(aspect)
+
+        # 网格数不需要超过图片像素数的一半，并限制在配置的最小、最大值之间
+        scale = min(1.0, pixels / 2 / max(nx, ny), max_size / max(nx, ny))
+        nx = min(max(int(round(nx * scale)), min_size), max_size)
+        ny = min(max(int(round(ny * scale)), min_size), max_size)
+        return nx, ny
+
+    def interpolate(self, data, surface=True):
+        # 使用RBF插值函数进行曲面拟合，返回二维等高线图网格及（可选的）三维曲面图网格
+        return self.interpolate_group([data], surface)[0]
+
+    def interpolate_group(self, rawdata, surface=True):
+        # 对量测点布局相同的多个量测位置插值，返回每个位置的网格
+        # 直接使用量测点数组的列视图，不复制数据
+        x = rawdata[0]['pos'][:, 0]
+        y = rawdata[0]['pos'][:, 1]
+        dpi = self.config["plotDPI"]
+
+        # 二维等高线图与三维曲面图分别使用不同精度的插值网格，三维曲面不需要太多面片
+        pixels = max(self.figure_2d.get_size_inches()) * dpi
+        nx, ny = self.get_grid_shape(x, y, pixels, self.config["gridMaxSize"])
+        xnew, ynew = np.mgrid[np.min(x):np.max(x):complex(nx), np.min(y):np.max(y):complex(ny)]
+        if surface:
+            pixels = max(self.figure_3d.get_size_inches()) * dpi
+            sx, sy = self.get_grid_shape(x, y, pixels, self.config["surfaceGridMaxSize"])
+            xsurf, ysurf = np.mgrid[np.min(x):np.max(x):complex(sx), np.min(y):np.max(y):complex(sy)]
+
+        # 相同的量测点布局使用缓存的求值矩阵 E（网格点数×量测点数），插值只需要一次矩阵乘法，
+        # 多个位置的Z值组成 点数×位置数 的矩阵一起求值
+        def build():
+            basis = interpolate.Rbf(x, y, np.eye(len(x)), function=self.config['rbfFunction'], mode='N-D')
+            layout = {'grid': basis(xnew, ynew).reshape(nx * ny, len(x))}
+            if surface:
+                layout['surface'] = basis(xsurf, ysurf).reshape(sx * sy, len(x))
+            return layout
+
+        layout = self.layouts.get(
+            LayoutCache.key(rawdata[0]['pos'], self.config['rbfFunction'], (nx, ny), (sx, sy) if surface else None),
+            build, len(rawdata) > 1, (nx * ny + (sx * sy if surface else 0)) * len(x) * 8)
+        if layout is not None:
+            matrixZ = np.column_stack([data['pos'][:, 2] for data in rawdata])
+            znews = np.dot(layout['grid'], matrixZ)
+            if surface:
+                zsurfs = np.dot(layout['surface'], matrixZ)
+
+        grids = []
+        for index, data in enumerate(rawdata):
+            z = data['pos'][:, 2]
+            if layout is None:
+                func = interpolate.Rbf(x, y, z, function=self.config['rbfFunction'])
+                znew = func(xnew, ynew)
+            else:
+                func = None
+                znew = znews[:, index].reshape(nx, ny)
+            zoffset = znew.min()
+            znew = znew - zoffset
+            grid = {
+                'x': xnew,
+                'y': ynew,
+                'z': znew,
+                'zmax': math.ceil(znew.max() * 1000) / 1000,
+                'zoffset': zoffset,
+                # 前后对比时在前次量测的网格上求值，使用缓存时按需创建插值函数
+                'rbf': func or self.lazy_rbf(x, y, z),
+            }
+
+            if surface:
+                if layout is None:
+                    zsurf = func(xsurf, ysurf)
+                else:
+                    zsurf = zsurfs[:, index].reshape(sx, sy)
+                grid['surface'] = (xsurf, ysurf, zsurf - zoffset)
+            grids.append(grid)
+        return grids
+
+    def lazy_rbf(self, x, y, z):
+        return lambda xi, yi: interpolate.Rbf(x, y, z, function=self.config['rbfFunction'])(xi, yi)
+
+    def save_figure(self, figure, dirpath, filename, date, image_name):
+        # 保存图片；启用图片归档时将图片追加到归档文件中，不再单独生成图片文件
+        # 先在内存中生成图片再一次性写入，写入时间单独统计
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format=os.path.splitext(image_name)[1][1:] or "jpg",
+                       dpi=self.config["plotDPI"], bbox_inches="tight")
+        self.write_image(dirpath, filename, date, image_name, buffer)
+
+    def write_image(self, dirpath, filename, date, image_name, buffer):
+        # 将已经编码的图片写入文件或归档，按文件归档时每个数据文件（文件名不去除序号）一个归档
+        started = time.perf_counter()
+        mode = self.config['imageArchive']
+        if mode in ('file', 'day'):
+            if mode == 'file':
+                archive_name = self.config['imageArchiveFile'].format(filename=filename)
+            else:
+                archive_name = self.config['imageArchiveDailyFile'].format(date=date or datetime.now().strftime("%Y-%m-%d"))
+            self.archives.append(os.path.join(dirpath, archive_name), image_name, buffer.getvalue())
+        else:
+            with open(os.path.join(dirpath, image_name), 'wb') as f:
+                f.write(buffer.getbuffer())
+        self.write_time += time.perf_counter() - started
+
+    def plot_3d(self, dirpath, filename, data, grid):
+        # 绘制三维曲面图
+        x = data['pos'][:, 0]
+        y = data['pos'][:, 1]
+        minX, maxX, minY, maxY = self.get_axes_limit(x, y)
+        xsurf, ysurf, zsurf = grid['surface']
+        self.figure_3d.clf()
+        ax_3d = Axes3D(self.figure_3d, auto_add_to_figure=False)
+        ax_3d.set_title(f"{data['sn']} {data['location']}", fontfamily='SimHei', loc='right')
+        ax_3d.set_xlabel('X')
+        ax_3d.set_ylabel('Y')
+        ax_3d.set_zlabel('Z')
+        ax_3d.view_init(elev=60, azim=-70)
+        ax_3d.set_xlim(minX, maxX)
+        ax_3d.set_ylim(minY, maxY)
+        self.figure_3d.add_axes(ax_3d)
+        surf = ax_3d.plot_surface(
+            xsurf, ysurf, zsurf, cmap=self.config['colorMap'], vmin=0, vmax=grid['zmax'])
+        self.figure_3d.colorbar(surf, shrink=0.6, aspect=10)
+        self.figure_3d.canvas.draw()
+        name = self.output_name(filename)
+        filename_3d = self.config['output3DFile'].format(filename=name, sn=data['sn'], location=data['location'])
+        self.save_figure(self.figure_3d, dirpath, filename, data['date'], filename_3d)
+
+    def plot_2d(self, dirpath, filename, data, grid):
+        # 创建二维等高线图；plot2DRenderer 为 express 时不经过 matplotlib，直接用 NumPy 和 Pillow 生成图片
+        if self.config['plot2DRenderer'] == 'express':
+            self.plot_2d_express(dirpath, filename, data, grid)
+            return
+        x = data['pos'][:, 0]
+        y = data['pos'][:, 1]
+        minX, maxX, minY, maxY = self.get_axes_limit(x, y)
+        self.figure_2d.clf()
+        ax_2d = self.figure_2d.add_subplot(111)
+        ax_2d.set_title(f"{data['sn']} {data['location']}", fontfamily='SimHei')
+        ax_2d.set_xlabel('X')
+        ax_2d.set_ylabel('Y')
+        ax_2d.set_xlim(minX, maxX)
+        ax_2d.set_ylim(minY, maxY)
+        contour = ax_2d.contourf(grid['x'], grid['y'], grid['z'], cmap=self.config['colorMap'], vmin=0, vmax=grid['zmax'])
+        self.figure_2d.colorbar(contour, shrink=0.8, aspect=10)
+        ax_2d.scatter(x, y, c='r', marker='o')
+        self.figure_2d.canvas.draw()
+        name = self.output_name(filename)
+        filename_2d = self.config['output2DFile'].format(filename=name, sn=data['sn'], location=data['location'])
+        self.save_figure(self.figure_2d, dirpath, filename, data['date'], filename_2d)
+
+    def font(self, size):
+        # 优先使用黑体显示中文，系统中没有黑体时使用 Pillow 的默认字体
+        if size not in self._fonts:
+            try:
+                self._fonts[size] = ImageFont.truetype("simhei.ttf", size)
+            except OSError:
+                try:
+                    self._fonts[size] = ImageFont.load_default(size)
+                except TypeError:
+                    self._fonts[size] = ImageFont.load_default()
+        return self._fonts[size]
+
+    def plot_2d_express(self, dirpath, filename, data, grid):
+        # 快速二维平整度图：插值网格经颜色查找表直接映射为像素，叠加量测点和颜色刻度，由 Pillow 编码
+        if self._lut is None:
+            colors = matplotlib.colormaps[self.config['colorMap']](np.linspace(0, 1, 256))
+            self._lut = (colors[:, :3] * 255).round().astype(np.uint8)
+        width, height = (int(v * self.config["plotDPI"]) for v in self.figure_2d.get_size_inches())
+        left, top, bottom, legend = 50, 30, 30, 80
+        size = max(min(width - left - legend, height - top - bottom), 10)
+        image = Image.new("RGB", (left + size + legend, top + size + bottom), "white")
+        draw = ImageDraw.Draw(image)
+        font = self.font(12)
+
+        # 绘图区域按坐标轴范围划分像素，每个像素的值由相邻的4个网格点双线性插值；网格范围以外保持白色
+        x = data['pos'][:, 0]
+        y = data['pos'][:, 1]
+        minX, maxX, minY, maxY = self.get_axes_limit(x, y)
+        px = minX + (np.arange(size) + 0.5) / size * (maxX - minX)
+        py = maxY - (np.arange(size) + 0.5) / size * (maxY - minY)
+        gx = grid['x'][:, 0]
+        gy = grid['y'][0, :]
+        fx = np.clip((px - gx[0]) / max(gx[-1] - gx[0], 1e-12) * (len(gx) - 1), 0, len(gx) - 1)
+        fy = np.clip((py - gy[0]) / max(gy[-1] - gy[0], 1e-12) * (len(gy) - 1), 0, len(gy) - 1)
+        ix = np.minimum(fx.astype(np.int64), len(gx) - 2) if len(gx) > 1 else np.zeros(size, dtype=np.int64)
+        iy = np.minimum(fy.astype(np.int64), len(gy) - 2) if len(gy) > 1 else np.zeros(size, dtype=np.int64)
+        wx = (fx - ix)[None, :]
+        wy = (fy - iy)[:, None]
+        z = np.pad(grid['z'], ((0, 1), (0, 1)), mode='edge')
+        xi = ix[None, :]
+        yi = iy[:, None]
+        value = ((z[xi, yi] * (1 - wx) + z[xi + 1, yi] * wx) * (1 - wy) +
+                 (z[xi, yi + 1] * (1 - wx) + z[xi + 1, yi + 1] * wx) * wy)
+        zmax = grid['zmax'] or 0.001
+        pixels = self._lut[np.clip((value / zmax * 255).astype(np.int64), 0, 255)]
+        inside = ((py >= gy[0]) & (py <= gy[-1]))[:, None] & ((px >= gx[0]) & (px <= gx[-1]))[None, :]
+        pixels[~inside] = 255
+        image.paste(Image.fromarray(pixels), (left, top))
+        draw.rectangle([left - 1, top - 1, left + size, top + size], outline="black")
+
+        # 量测点
+        sx = left + (x - minX) / max(maxX - minX, 1e-12) * size
+        sy = top + (maxY - y) / max(maxY - minY, 1e-12) * size
+        for cx, cy in zip(sx.tolist(), sy.tolist()):
+            draw.ellipse([cx - 2, cy - 2, cx + 2, cy + 2], fill="red")
+
+        # 标题、坐标范围和颜色刻度
+        draw.text((left + size / 2, top / 2), f"{data['sn']} {data['location']}", fill="black", font=self.font(14), anchor="mm")
+        draw.text((left, top + size + 4), f"{minX:.2f}", fill="black", font=font, anchor="la")
+        draw.text((left + size, top + size + 4), f"{maxX:.2f}", fill="black", font=font, anchor="ra")
+        draw.text((left - 4, top + size), f"{minY:.2f}", fill="black", font=font, anchor="rs")
+        draw.text((left - 4, top), f"{maxY:.2f}", fill="black", font=font, anchor="rt")
+        barX = left + size + 15
+        bar = self._lut[np.linspace(255, 0, size).astype(np.int64)][:, None, :].repeat(15, axis=1)
+        image.paste(Image.fromarray(np.ascontiguousarray(bar)), (barX, top))
+        draw.rectangle([barX - 1, top - 1, barX + 15, top + size], outline="black")
+        for fraction in (0, 0.25, 0.5, 0.75, 1):
+            ty = top + size - fraction * size
+            draw.line([barX + 15, ty, barX + 19, ty], fill="black")
+            draw.text((barX + 22, ty), f"{zmax * fraction:.3f}", fill="black", font=font, anchor="lm")
+
+        name = self.output_name(filename)
+        image_name = self.config['output2DFile'].format(filename=name, sn=data['sn'], location=data['location'])
+        buffer = io.BytesIO()
+        image_format = os.path.splitext(image_name)[1][1:].upper() or "JPEG"
+        image.save(buffer, format="JPEG" if image_format == "JPG" else image_format, quality=90)
+        self.write_image(dirpath, filename, data['date'], image_name, buffer)
+
+    def compare(self, grid_cache, dirpath, filename, rawdata, grids, timings):
+        # 与缓存中同一板编号、量测位置的前次量测对比，输出差异图并返回平整度变化；当前网格替换缓存
+        # 当前量测的插值函数直接在前次量测的网格上求值，不需要重新解析或插值前次的数据文件
+        source = os.path.join(dirpath, filename)
+        differences = []
+        for data, grid in zip(rawdata, grids):
+            key = (data['sn'], data['location'])
+            previous = grid_cache.get(key)
+            if previous is not None and previous['source'] != source:
+                started = time.perf_counter()
+                x = data['pos'][:, 0]
+                y = data['pos'][:, 1]
+                xprev, yprev = np.meshgrid(previous['x'], previous['y'], indexing='ij')
+                delta = grid['rbf'](xprev, yprev) - previous['z']
+                # 超出当前量测范围的区域为外推结果，不参与对比
+                outside = (xprev < x.min()) | (xprev > x.max()) | (yprev < y.min()) | (yprev > y.max())
+                delta[outside] = np.nan
+                timings['interpolate'] += time.perf_counter() - started
+                started = time.perf_counter()
+                self.plot_difference(dirpath, filename, data, previous, xprev, yprev, delta)
+                timings['render'] += time.perf_counter() - started
+                differences.append({
+                    'sn': data['sn'],
+                    'location': data['location'],
+                    'file': previous['filename'],
+                    'date': previous['date'],
+                    'time': previous['time'],
+                    'flatness': previous['flatness'],
+                    'delta': round(data['flatness'] - previous['flatness'], 4),
+                })
+            grid_cache.put(key, {
+                'source': source,
+                'filename': filename,
+                'date': data['date'],
+                'time': data['time'],
+                'flatness': data['flatness'],
+                'x': grid['x'][:, 0],
+                'y': grid['y'][0, :],
+                'z': (grid['z'] + grid['zoffset']).astype(np.float32),
+            })
+        return differences
+
+    def plot_difference(self, dirpath, filename, data, previous, x, y, delta):
+        # 绘制前后两次量测的Z'差异图，颜色刻度以0为中心对称
+        limit = float(np.nanmax(np.abs(delta))) if np.isfinite(delta).any() else 0.0
+        limit = limit or 0.001
+        self.figure_2d.clf()
+        ax_2d = self.figure_2d.add_subplot(111)
+        ax_2d.set_title(f"{data['sn']} {data['location']}  {previous['flatness']} → {data['flatness']}",
+                        fontfamily='SimHei')
+        ax_2d.set_xlabel('X')
+        ax_2d.set_ylabel('Y')
+        minX, maxX, minY, maxY = self.get_axes_limit(x, y)
+        ax_2d.set_xlim(minX, maxX)
+        ax_2d.set_ylim(minY, maxY)
+        contour = ax_2d.contourf(x, y, np.ma.masked_invalid(delta),
+                                 levels=np.linspace(-limit, limit, 21), cmap='RdBu_r')
+        self.figure_2d.colorbar(contour, shrink=0.8, aspect=10)
+        ax_2d.scatter(data['pos'][:, 0], data['pos'][:, 1], c='k', marker='o', s=4)
+        self.figure_2d.canvas.draw()
+        name = self.output_name(filename)
+        filename_diff = self.config['differenceOutputFile'].format(filename=name, sn=data['sn'], location=data['location'])
+        self.save_figure(self.figure_2d, dirpath, filename, data['date'], filename_diff)
+
+    def plot_sheet(self, dirpath, filename, rawdata, grids):
+        # 每个板编号输出一张汇总图，所有量测位置使用相同的颜色刻度，整张图只绘制和写入一次
+        boards = {}
+        for data, grid in zip(rawdata, grids):
+            boards.setdefault(data['sn'], []).append((data, grid))
+
+        color_map = self.config['colorMap']
+        for sn, items in boards.items():
+            zmax = max(grid['zmax'] for _, grid in items) or 0.001
+            levels = np.linspace(0, zmax, 11)
+            cols = math.ceil(math.sqrt(len(items)))
+            rows = math.ceil(len(items) / cols)
+            figure = Figure(figsize=(3 * cols + 1, 3 * rows))
+            FigureCanvasAgg(figure)
+            axes = figure.subplots(rows, cols, squeeze=False)
+            contour = None
+            for ax, (data, grid) in zip(axes.flat, items):
+                minX, maxX, minY, maxY = self.get_axes_limit(data['pos'][:, 0], data['pos'][:, 1])
+                ax.set_title(f"{data['location']}  {data['flatness']}", fontfamily='SimHei', fontsize=9)
+                ax.set_xlim(minX, maxX)
+                ax.set_ylim(minY, maxY)
+                ax.tick_params(labelsize=7)
+                contour = ax.contourf(grid['x'], grid['y'], grid['z'], levels=levels, cmap=color_map)
+                ax.scatter(data['pos'][:, 0], data['pos'][:, 1], c='r', marker='o', s=4)
+            for ax in axes.flat[len(items):]:
+                ax.set_axis_off()
+            figure.suptitle(sn, fontfamily='SimHei')
+            figure.colorbar(contour, ax=axes.ravel().tolist(), shrink=0.8, aspect=20)
+            name = self.output_name(filename)
+            filename_sheet = self.config['outputSheetFile'].format(filename=name, sn=sn)
+            self.save_figure(figure, dirpath, filename, items[0][0]['date'], filename_sheet)
+
+
+class ResultTableModel(QAbstractTableModel):
+    # 分析结果表格模型：按列保存本次运行的所有平整度结果，表格按需分批读取行，支持排序和按板编号、量测位置、中心形貌筛选
+    # 未排序、未筛选时新结果直接追加到末尾；排序后新结果按二分查找插入到对应位置
+    FETCH_SIZE = 2000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.columns = {field: [] for field in RESULT_FIELDS}
+        self.view = None                # 筛选、排序后的行号列表（按升序排列），None 表示全部行按加入顺序显示
+        self.loaded = 0                 # 已提供给表格的行数
+        self.sort_field = None
+        self.descending = False
+        self.filters = {}               # 字段 -> 筛选用的正则表达式
+        self._strings = {}
+
+    def total(self):
+        return len(self.columns['file']) if self.view is None else len(self.view)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(RESULT_FIELDS)
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.loaded < self.total()
+
+    def fetchMore(self, parent):
+        count = min(self.FETCH_SIZE, self.total() - self.loaded)
+        if parent.isValid() or count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+        self.loaded += count
+        self.endInsertRows()
+
+    def row_id(self, row):
+        if self.view is None:
+            return row
+        return self.view[len(self.view) - 1 - row] if self.descending else self.view[row]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        field = RESULT_FIELDS[index.column()]
+        if role == Qt.DisplayRole:
+            value = self.columns[field][self.row_id(index.row())]
+            return f"{value:.4f}" if field == 'flatness' else value
+        if role == Qt.TextAlignmentRole and field == 'flatness':
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return RESULT_HEADER[section]
+        return super().headerData(section, orientation, role)
+
+    def matches(self, row_id):
+        return all(regex.match(self.columns[field][row_id]) for field, regex in self.filters.items())
+
+    def append(self, row):
+        # 加入一行结果（按 RESULT_FIELDS 顺序），只有插入位置在已读取范围内时才通知表格
+        total = self.total()
+        row_id = len(self.columns['file'])
+        for field, value in zip(RESULT_FIELDS, row):
+            self.columns[field].append(self._strings.setdefault(value, value) if isinstance(value, str) else value)
+        if self.view is None:
+            position = row_id
+        else:
+            if not self.matches(row_id):
+                return
+            if self.sort_field is None:
+                index = len(self.view)
+            else:
+                # 二分查找插入位置（按排序字段升序，相同值排在已有行之后）
+                column = self.columns[self.sort_field]
+                value = column[row_id]
+                lo, hi = 0, len(self.view)
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if value < column[self.view[mid]]:
+                        hi = mid
+                    else:
+                        lo = mid + 1
+                index = lo
+            self.view.insert(index, row_id)
+            position = total - index if self.descending else index
+        if position < self.loaded or self.loaded == total:
+            self.beginInsertRows(QModelIndex(), position, position)
+            self.loaded += 1
+            self.endInsertRows()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # column 小于0时恢复按加入顺序显示
+        self.sort_field = RESULT_FIELDS[column] if 0 <= column < len(RESULT_FIELDS) else None
+        self.descending = self.sort_field is not None and order == Qt.DescendingOrder
+        self.rebuild()
+
+    def set_filters(self, sn="", location="", shape=""):
+        # 板编号、量测位置支持通配符，中心形貌为精确匹配，空字符串表示不筛选
+        filters = {}
+        for field, pattern in (('sn', sn), ('location', location)):
+            if pattern:
+                filters[field] = re.compile(fnmatch.translate(pattern), re.IGNORECASE)
+        if shape:
+            filters['shape'] = re.compile(re.escape(shape) + r"\Z")
+        self.filters = filters
+        self.rebuild()
+
+    def rebuild(self):
+        self.beginResetModel()
+        if not self.filters and self.sort_field is None:
+            self.view = None
+        else:
+            row_ids = range(len(self.columns['file']))
+            if self.filters:
+                row_ids = [row_id for row_id in row_ids if self.matches(row_id)]
+            if self.sort_field is not None:
+                row_ids = sorted(row_ids, key=self.columns[self.sort_field].__getitem__)
+            self.view = list(row_ids)
+        self.loaded = min(self.FETCH_SIZE, self.total())
+        self.endResetModel()
+
 
 class MyMainWindow(QMainWindow, Ui_MainWindow):
     start_thread_signal = Signal()
@@ -297,7 +2954,6 @@ class MyMainWindow(QMainWindow, Ui_MainWindow):
     stop_thread_signal = Signal()
     resume_thread_signal = Signal()
     terminate_thread_signal = Signal()
-    process_next_signal = Signal()
 
     def __init__(self):
         super().__init__()
@@ -306,80 +2962,99 @@ class MyMainWindow(QMainWindow, Ui_MainWindow):
         self.setWindowTitle("平整度自动分析程序")
         self.setWindowIcon(QIcon(":/icon.ico"))
         self.folderPath.setText(self.config["dataDirectory"])
-        self._stop_event = True
-        self.figure_3d = plt.figure()
-        self.figure_2d = plt.figure()
+        self._last_memory_log = datetime.now()
 
         self.btnStop.setEnabled(False)
         self.processLog.setReadOnly(True)
         self.processLog.setMaximumBlockCount(1000)
 
+        # 分析结果表格：固定行高，表格只绘制可见行
+        self.results_model = ResultTableModel(self)
+        self.resultsTable.setModel(self.results_model)
+        self.resultsTable.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.resultsTable.verticalHeader().setDefaultSectionSize(self.fontMetrics().height() + 6)
+        self.resultsTable.horizontalHeader().setStretchLastSection(True)
+        self.resultsTable.sortByColumn(-1, Qt.AscendingOrder)
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(300)
+        self.filter_timer.timeout.connect(self.apply_result_filters)
+        self.filterSn.textChanged.connect(self.filter_timer.start)
+        self.filterLocation.textChanged.connect(self.filter_timer.start)
+        self.filterShape.currentIndexChanged.connect(self.apply_result_filters)
+
         self.analyzer_thread = FileAnalyzerThread()
         self.analyzer_thread.logging.connect(self.logging)
-        self.analyzer_thread.flatnessSignal.connect(self.create_plot)
         self.analyzer_thread.showInfoSignal.connect(self.statusbar.showMessage)
+        self.analyzer_thread.flatnessSignal.connect(self.add_result)
         self.start_thread_signal.connect(self.analyzer_thread.start)
         self.stop_thread_signal.connect(self.analyzer_thread.stop)
-        self.stop_thread_signal.connect(self.stop)
         self.terminate_thread_signal.connect(self.analyzer_thread.terminate)
         self.resume_thread_signal.connect(self.analyzer_thread.resume)
-        self.resume_thread_signal.connect(self.resume)
-        self.process_next_signal.connect(self.analyzer_thread.process_next)
         self.btnSelectFolder.clicked.connect(self.select_folder)
         self.btnStart.clicked.connect(self.start_analysis)
         self.btnStop.clicked.connect(self.stop_analysis)
         self.btnExit.clicked.connect(self.exit_application)  # 添加 btnExit 按钮点击事件处理函数
         self.update_config_signal.connect(self.analyzer_thread.update_config)
+        if self.config["spcEnabled"]:
+            self.analyzer_thread.spc_monitor = SpcMonitor(
+                app_file_path(self.config["spcStateFile"]),
+                sigma=self.config["spcSigma"],
+                min_samples=self.config["spcMinSamples"],
+                spec_limit=self.config["spcFlatnessLimit"])
         self.start_thread_signal.emit()
+        self.start_services()
 
         self.statusbar.showMessage("就绪。")  # 初始化状态栏信息
+        self.memoryLabel = QLabel()
+        self.statusbar.addPermanentWidget(self.memoryLabel)
+        self.memory_timer = QTimer(self)
+        self.memory_timer.timeout.connect(self.update_memory_usage)
+        self.memory_timer.start(5000)
         if self.config["autoStart"]:
             self.btnStart.click()
 
-    def resume(self):
-        self._stop_event = False
+    def start_services(self):
+        # 启动本地平整度结果查询服务，端口为0时不启动
+        self.query_service = None
+        host = self.config["queryServiceHost"]
+        port = self.config["queryServicePort"]
+        if port:
+            try:
+                self.query_service = ResultQueryService(
+                    host, port, self.analyzer_thread.result_index, self.analyzer_thread.spc_monitor,
+                    self.config["dataDirectory"])
+                self.query_service.start()
+                self.logging(f"平整度结果查询服务已启动：http://{host}:{port}/results", "INFO")
+            except OSError as e:
+                self.logging(f"平整度结果查询服务启动失败：{e}", "ERROR")
 
-    def stop(self):
-        self._stop_event = True
+        # 启动本地运行指标服务，端口为0时不启动
+        self.metrics_service = None
+        port = self.config["metricsPort"]
+        if port:
+            try:
+                self.metrics_service = MetricsService(host, port, self.analyzer_thread.metrics)
+                self.metrics_service.start()
+                self.logging(f"运行指标服务已启动：http://{host}:{port}/metrics", "INFO")
+            except OSError as e:
+                self.logging(f"运行指标服务启动失败：{e}", "ERROR")
 
-    def load_config(self):
-        # 获取当前脚本文件所在目录
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        config_path = os.path.join(script_dir, "config.json")
-
-        # 默认配置
-        default_config = {
-            "dataDirectory": "D:\\",
-            "centralZoneLimit": 0.5,
-            "rbfFunction": "thin_plate",
-            "colorMap": "rainbow",
-            "plotDPI": 100,
-            "scanDirectoryInterval": 30,
-            "filesFilter": "*平整度*.txt",
-            "locationFilter": "BGA",
-            "filenameReplPattern": "^(.*?)(\\-\\d{5})?$",
-            "filenameReplResult": "\\1",
-            "output2DFile": "{filename}_{sn}_{location}_2D.jpg",
-            "output3DFile": "{filename}_{sn}_{location}_3D.jpg",
-            "autoStart": True
-        }
+    def stop_services(self):
+        if self.query_service is not None:
+            self.query_service.stop()
+            self.query_service = None
+        if self.metrics_service is not None:
+            self.metrics_service.stop()
+            self.metrics_service = None
 
-        # 读取配置文件
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
+    def load_config(self):
+        self.config, found = read_config()
+        if not found:
             self.logging("配置文件 config.json不存在，使用默认配置。", "WARN")
-            config = {}
-
-        # 合并默认配置和读取的配置
-        default_config.update(config)
-        self.config = default_config
 
     def save_config(self):
-        # 获取当前脚本文件所在目录
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        config_path = os.path.join(script_dir, "config.json")
+        config_path = app_file_path("config.json")
 
         # 将配置保存到 config.json 文件中
         with open(config_path, 'w', encoding='utf-8') as f:
@@ -414,6 +3089,14 @@ class MyMainWindow(QMainWindow, Ui_MainWindow):
         self.processLog.appendHtml(f'<div style="color: {color}">[{now}] {message}</div>')
         self.processLog.verticalScrollBar().setValue(self.processLog.verticalScrollBar().maximum())
 
+    def add_result(self, dirpath, filename, bga):
+        self.results_model.append(
+            [filename, bga['date'], bga['time'], bga['sn'], bga['location'], bga['shape'], bga['flatness']])
+
+    def apply_result_filters(self):
+        shape = self.filterShape.currentText() if self.filterShape.currentIndex() > 0 else ""
+        self.results_model.set_filters(self.filterSn.text().strip(), self.filterLocation.text().strip(), shape)
+
     def select_folder(self):
         selected_dir = QFileDialog.getExistingDirectory(
             parent=None,          # 父窗口（None表示无父窗口）
@@ -427,112 +3110,323 @@ class MyMainWindow(QMainWindow, Ui_MainWindow):
             self.config["dataDirectory"] = selected_dir
             self.save_config()
             self.update_config_signal.emit(self.config)
+            if self.query_service is not None:
+                self.query_service.image_root = selected_dir
 
     def closeEvent(self, event):
         self.stop_thread_signal.emit()
         self.terminate_thread_signal.emit()
-        plt.close(self.figure_3d)
-        plt.close(self.figure_2d)
+        self.stop_services()
         self.analyzer_thread.wait()  # 等待线程结束
         event.accept()
 
     def exit_application(self):  # 新增的退出应用程序函数
         self.stop_thread_signal.emit()
         self.terminate_thread_signal.emit()
-        plt.close(self.figure_3d)
-        plt.close(self.figure_2d)
+        self.stop_services()
         self.analyzer_thread.wait()  # 等待线程结束
         QApplication.quit()  # 退出应用程序
 
-    def get_axes_limit(self, serialx, serialy):
-        # 根据X、Y坐标数据计算图表坐标轴显示范围
-        xmin = np.min(serialx)
-        xmax = np.max(serialx)
-        xavg = (xmin + xmax) / 2
-        ymin = np.min(serialy)
-        ymax = np.max(serialy)
-        yavg = (ymin + ymax) / 2
-        xrange = xmax - xmin
-        yrange = ymax - ymin
-        if xrange > yrange:
-            half_range = xrange / 2
-            return xmin, xmax, yavg - half_range, yavg + half_range
+    def update_memory_usage(self):
+        # 在状态栏显示主程序及绘图进程的内存占用，并定期写入日志
+        usage = memory_usage()
+        worker = self.analyzer_thread.render_worker
+        telemetry = worker.telemetry if worker is not None else {}
+        text = f"内存：{usage['rss'] / 1048576:.0f} MB"
+        if telemetry:
+            text += f" | 绘图进程：{telemetry['rss'] / 1048576:.0f} MB"
+        self.memoryLabel.setText(text)
+
+        interval = float(self.config["memoryLogInterval"])
+        if interval > 0 and (datetime.now() - self._last_memory_log).total_seconds() >= interval:
+            self._last_memory_log = datetime.now()
+            message = f"内存占用：主程序 {usage['rss'] / 1048576:.1f} MB，Python内存块 {usage['blocks']}"
+            if telemetry:
+                message += (f"；绘图进程 {telemetry['rss'] / 1048576:.1f} MB，Python内存块 {telemetry['blocks']}，"
+                            f"图形对象 {telemetry['artists']}，已完成任务 {telemetry['tasks']}")
+            if worker is not None:
+                message += f"；绘图进程已回收 {worker.recycled} 次"
+            self.logging(message, "INFO")
+
+
+def render_command(config, args):
+    # 按需输出数据文件中指定量测位置的二维等高线图和三维曲面图
+    analyzer = FileAnalyzerThread()
+    analyzer.update_config(config)
+    analyzer.logging.connect(lambda message, level: print(f"[{level}] {message}"))
+    plotter = FlatnessPlotter(config)
+
+    dirpath = args.output or os.path.dirname(split_archive_path(os.path.abspath(args.file))[0])
+    filename = os.path.splitext(os.path.basename(strip_compression(args.file)))[0]
+    try:
+        rawdata = analyzer.load_txt_file(args.file)
+    except (OSError, zipfile.BadZipFile) as e:
+        print(f"[ERROR] 读取文件 {args.file} 时出现错误：{e}")
+        return 1
+    count = 0
+    for bga in rawdata:
+        if args.location and not fnmatch.fnmatch(bga['location'].upper(), args.location.upper()):
+            continue
+        analyzer.calcFlatness(bga)
+        data = analyzer.decimate(filename, bga, int(config['interpolationMaxPoints']))
+        grid = plotter.interpolate(data)
+        plotter.plot_3d(dirpath, filename, data, grid)
+        plotter.plot_2d(dirpath, filename, data, grid)
+        print(f"{bga['sn']} {bga['location']} 平整度 {bga['flatness']}")
+        count += 1
+    plotter.archives.flush()
+    if analyzer.events is not None:
+        analyzer.events.close()
+    return 0 if count else 1
+
+
+def backfill_command(config, args):
+    # 历史数据批量分析：每批先解析多个文件，将所有量测位置按XY布局分组，同组的平面拟合、Z'投影、
+    # 平整度/形貌及插值网格合并为矩阵运算，再按文件输出与自动分析相同的结果文件
+    analyzer = FileAnalyzerThread()
+    analyzer.update_config(config)
+    analyzer.logging.connect(lambda message, level: print(f"[{level}] {message}"))
+    plotter = FlatnessPlotter(config) if args.images else None
+    regional = config['regionalGrid'] if config['regionalAnalysis'] else None
+    max_points = int(config['interpolationMaxPoints'])
+
+    root = args.directory or config['dataDirectory']
+    scanner = DirectoryScanner(
+        config['filesFilter'], config['excludeFilter'] + ";" + LEASE_DIRNAME, config['maxScanDepth'],
+        config['archiveFilter'])
+    pending = [item[:4] for item in scan_inputs(scanner, root) if args.force or not item[4]]
+    print(f"共 {len(pending)} 个数据文件需要分析")
+
+    started = time.perf_counter()
+    analyzed = failed = count = 0
+    for start in range(0, len(pending), args.batch):
+        batch = []
+        analyzer.timings = {}   # 各阶段耗时按批统计
+        for dirpath, fullfilename, filename, result_file in pending[start:start + args.batch]:
+            file_path = os.path.join(dirpath, fullfilename)
+            stage_started = time.perf_counter()
+            try:
+                rawdata = analyzer.load_txt_file(file_path, encoding=args.encoding)
+            except (OSError, zipfile.BadZipFile) as e:
+                print(f"[ERROR] 读取文件 {fullfilename} 时出现错误：{e}")
+                analyzer.log_event('file_failed', file=file_path, message=str(e))
+                failed += 1
+                continue
+            seconds = time.perf_counter() - stage_started
+            analyzer.observe_stage('parse', seconds)
+            if rawdata:
+                batch.append((dirpath, fullfilename, filename, result_file, rawdata))
+                analyzer.log_event('file_parsed', file=file_path, bgas=len(rawdata), seconds=seconds)
+            else:
+                print(f"[ERROR] 文件 {fullfilename} 中没有找到量测数据！")
+                analyzer.log_event('file_skipped', file=file_path, reason='no_data')
+                failed += 1
+
+        # 按量测点布局分组，同组各位置的XY坐标完全相同
+        stage_started = time.perf_counter()
+        groups = collections.defaultdict(list)
+        owners = {}
+        for item in batch:
+            for bga in item[4]:
+                groups[LayoutCache.key(bga['pos'])].append(bga)
+                owners[id(bga)] = item
+        errors = set()
+        for group in groups.values():
+            try:
+                analyzer.calcFlatnessGroup(group)
+            except ValueError as e:
+                errors.update(owners[id(bga)][3] for bga in group)
+                print(f"[ERROR] {e}")
+                for bga in group:
+                    analyzer.log_event('error', file=os.path.join(*owners[id(bga)][:2]), sn=bga['sn'],
+                                   location=bga['location'], message=str(e))
+        analyzer.observe_stage('fit', time.perf_counter() - stage_started)
+
+        if plotter is not None:
+            stage_started = time.perf_counter()
+            for group in groups.values():
+                group = [bga for bga in group if owners[id(bga)][3] not in errors]
+                if not group:
+                    continue
+                # 同组位置分块插值，每块绘图并写入归档后再处理下一块，内存占用不随批次大小增长
+                for begin in range(0, len(group), plotter.GROUP_CHUNK):
+                    chunk = group[begin:begin + plotter.GROUP_CHUNK]
+                    if len(chunk[0]['pos']) > max_points > 0:
+                        # 抽样后的点与Z值有关，布局不再相同，逐个插值
+                        rawdata = [analyzer.decimate(owners[id(bga)][2], bga, max_points) for bga in chunk]
+                        grids = (plotter.interpolate(data) for data in rawdata)
+                    else:
+                        rawdata = chunk
+                        grids = plotter.interpolate_group(chunk)
+                    for bga, data, grid in zip(chunk, rawdata, grids):
+                        dirpath, _, filename = owners[id(bga)][:3]
+                        plotter.plot_3d(dirpath, filename, data, grid)
+                        plotter.plot_2d(dirpath, filename, data, grid)
+                    del rawdata, grids
+                    plotter.archives.flush()
+            analyzer.observe_stage('render', time.perf_counter() - stage_started)
+
+        stage_started = time.perf_counter()
+        for dirpath, fullfilename, filename, result_file, rawdata in batch:
+            if result_file in errors:
+                print(f"[ERROR] 文件 {fullfilename} 分析平整度时出现错误，未保存结果")
+                analyzer.log_event('file_failed', file=os.path.join(dirpath, fullfilename), message="分析平整度时出现错误")
+                failed += 1
+                continue
+            result = [RESULT_HEADER]
+            for bga in rawdata:
+                if regional:
+                    bga['regional'] = analyzer.calcRegional(bga, regional)
+                result.append([filename, bga['date'], bga['time'], bga['sn'], bga['location'], bga['shape'],
+                               bga['flatness']])
+                analyzer.log_event('bga_result', dirpath=dirpath, file=filename, date=bga['date'], time=bga['time'],
+                               sn=bga['sn'], location=bga['location'], shape=bga['shape'], flatness=bga['flatness'],
+                               points=len(bga['pos']))
+            temp_file = f"{result_file}.{uuid.uuid4().hex}.tmp"
+            with open(temp_file, mode='w', newline='', encoding='gb2312') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerows(result)
+            os.replace(temp_file, result_file)
+            if regional:
+                analyzer.save_regional(
+                    os.path.join(dirpath, config['regionalOutputFile'].format(filename=filename)), rawdata)
+            analyzed += 1
+            count += len(rawdata)
+        analyzer.observe_stage('write', time.perf_counter() - stage_started)
+        analyzer.log_event('stage_timings', file=None, files=len(batch), stages=analyzer.timings)
+
+        elapsed = time.perf_counter() - started
+        print(f"已分析 {analyzed} 个文件，{count} 个量测位置，{len(groups)} 种量测点布局，"
+              f"耗时 {elapsed:.1f} 秒（{count / max(elapsed, 1e-9):.0f} 个位置/秒）")
+    if analyzer.events is not None:
+        analyzer.events.close()
+    return 0 if not failed else 1
+
+
+def images_command(config, args):
+    # 列出图片归档中的图片，或取出指定图片
+    if not args.name:
+        for name in ImageArchive.list(args.archive):
+            print(name)
+        return 0
+    output = args.output or args.name
+    with open(output, 'wb') as f:
+        f.write(ImageArchive.read(args.archive, args.name))
+    print(output)
+    return 0
+
+
+def events_command(config, args):
+    # 从结构化事件日志重建平整度结果表或阶段耗时报告，不需要读取原始数据文件
+    path = args.log or app_file_path(config['eventLogFile'])
+    events = (event for event in EventLogger.read(path)
+              if (not args.since or event['ts'] >= args.since) and (not args.until or event['ts'] < args.until))
+
+    if args.report == 'results':
+        # 同一文件同一量测位置重复分析时以最后一次结果为准
+        rows = collections.OrderedDict()
+        for event in events:
+            if event['event'] == 'bga_result':
+                key = (event['dirpath'], event['file'], event['sn'], event['location'])
+                rows.pop(key, None)
+                rows[key] = [event['file'], event['date'], event['time'], event['sn'], event['location'],
+                             event['shape'], event['flatness']]
+        if args.output:
+            with open(args.output, mode='w', newline='', encoding='gb2312', errors='replace') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(RESULT_HEADER)
+                writer.writerows(rows.values())
+            print(f"共 {len(rows)} 条结果，已保存到 {args.output}")
         else:
-            half_range = yrange / 2
-            return xavg - half_range, xavg + half_range, ymin, ymax
+            writer = csv.writer(sys.stdout)
+            writer.writerow(RESULT_HEADER)
+            writer.writerows(rows.values())
+        return 0
 
-    def create_plot(self, dirpath, filename, data):
-        # 使用matplotlib绘制三维曲面图及二维等高线图，并将图形保存到指定路径
-        # 提取 x, y, z 坐标
-        QCoreApplication.processEvents()
-        if self._stop_event:
-            return
-        
-        try:
-            x = [point[0] for point in data['pos']]
-            y = [point[1] for point in data['pos']]
-            z = [point[2] for point in data['pos']]
-            minX, maxX, minY, maxY = self.get_axes_limit(x, y)
-
-            # 使用RBF插值函数进行曲面拟合
-            func_name = self.config['rbfFunction']
-            color_map = self.config['colorMap']
-            func = interpolate.Rbf(x, y, z, function=func_name)
-            xnew, ynew = np.mgrid[np.min(x):np.max(x):50j, np.min(y):np.max(y):50j]
-            znew = func(xnew, ynew)
-            znew = znew - znew.min()
-            zmax = math.ceil(znew.max() * 1000) / 1000
-
-            dpi = self.config["plotDPI"]    # 输出图片的DPI，文件大小和DPI平方呈正比
-            filename = re.sub(self.config['filenameReplPattern'],self.config['filenameReplResult'],filename)
-
-            # 绘制三维曲面图
-            QCoreApplication.processEvents()
-            if self._stop_event:
-                return
-            self.figure_3d.clf()
-            ax_3d = Axes3D(self.figure_3d, auto_add_to_figure=False)
-            ax_3d.set_title(f"{data['sn']} {data['location']}", fontfamily='SimHei', loc='right')
-            ax_3d.set_xlabel('X')
-            ax_3d.set_ylabel('Y')
-            ax_3d.set_zlabel('Z')
-            ax_3d.view_init(elev=60, azim=-70)
-            ax_3d.set_xlim(minX, maxX)
-            ax_3d.set_ylim(minY, maxY)
-            self.figure_3d.add_axes(ax_3d)
-            surf = ax_3d.plot_surface(
-                xnew, ynew, znew, cmap=color_map, vmin=0, vmax=zmax)
-            self.figure_3d.colorbar(surf, shrink=0.6, aspect=10)
-            self.figure_3d.canvas.draw()
-            filename_3d=self.config['output3DFile'].format(filename=filename,sn=data['sn'],location=data['location'])
-            plot3d_file = os.path.join(dirpath, filename_3d)
-            self.figure_3d.savefig(plot3d_file, dpi=dpi, bbox_inches="tight")
-
-            # 创建二维等高线图
-            QCoreApplication.processEvents()
-            if self._stop_event:
-                return
-            self.figure_2d.clf()
-            ax_2d = self.figure_2d.add_subplot(111)
-            ax_2d.set_title(f"{data['sn']} {data['location']}", fontfamily='SimHei')
-            ax_2d.set_xlabel('X')
-            ax_2d.set_ylabel('Y')
-            ax_2d.set_xlim(minX, maxX)
-            ax_2d.set_ylim(minY, maxY)
-            contour = ax_2d.contourf(xnew, ynew, znew, cmap=color_map, vmin=0, vmax=zmax)
-            self.figure_2d.colorbar(contour, shrink=0.8, aspect=10)
-            ax_2d.scatter(x, y,  c='r', marker='o')
-            self.figure_2d.canvas.draw()
-            filename_2d=self.config['output2DFile'].format(filename=filename,sn=data['sn'],location=data['location'])
-            plot2d_file = os.path.join(dirpath, filename_2d)
-            self.figure_2d.savefig(plot2d_file, dpi=dpi, bbox_inches="tight")
-        except Exception as e:
-            self.logging(f"使用文件 {filename} 中数据进行绘图时出现错误: {e}", "ERROR")
-        finally:
-            self.process_next_signal.emit()
+    # 阶段耗时报告：每个阶段的记录次数（自动分析每个文件一次，批量分析每批一次）、总耗时、平均值、P95 和最大值，以及各类事件的数量
+    stages = collections.defaultdict(list)
+    counts = collections.Counter()
+    for event in events:
+        counts[event['event']] += 1
+        if event['event'] == 'stage_timings':
+            for stage, seconds in event['stages'].items():
+                stages[stage].append(seconds)
+    print(f"{'阶段':<12}{'次数':>8}{'总耗时(s)':>12}{'平均(ms)':>12}{'P95(ms)':>12}{'最大(ms)':>12}")
+    for stage, values in sorted(stages.items(), key=lambda item: -sum(item[1])):
+        values = np.array(values)
+        print(f"{stage:<12}{len(values):>8}{values.sum():>12.2f}{values.mean() * 1000:>12.1f}"
+              f"{np.percentile(values, 95) * 1000:>12.1f}{values.max() * 1000:>12.1f}")
+    print()
+    for event, count in sorted(counts.items()):
+        print(f"{event:<16}{count:>8}")
+    return 0
+
+
+def attach_console():
+    # 打包后的程序不显示控制台（compile.bat 使用 --noconsole），sys.stdout、sys.stderr 为 None：
+    # 在命令提示符中运行时连接到该窗口输出；没有可连接的窗口（如计划任务、快捷方式）时追加到 logs/command.log
+    # 返回输出是否显示在控制台中
+    if sys.stdout is not None and sys.stderr is not None:
+        return True
+    if os.name == 'nt' and ctypes.windll.kernel32.AttachConsole(-1):    # ATTACH_PARENT_PROCESS
+        stream = open('CONOUT$', 'w', errors='replace')
+        console = True
+    else:
+        path = app_file_path(os.path.join("logs", "command.log"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        stream = open(path, 'a', encoding='utf-8', buffering=1)
+        stream.write(f"\n[{datetime.now():%Y-%m-%d %H:%M:%S}] FlatScan {' '.join(sys.argv[1:])}\n")
+        console = False
+    sys.stdout = sys.stdout or stream
+    sys.stderr = sys.stderr or stream
+    return console
+
+
+def run_command_line(argv):
+    # 命令行模式，不启动图形界面
+    console = attach_console()
+    parser = argparse.ArgumentParser(prog="FlatScan", description="平整度自动分析程序")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    render = commands.add_parser("render", help="按需输出单个量测位置的二维/三维平整度图")
+    render.add_argument("file", help="三次元量测数据 txt 文件")
+    render.add_argument("-l", "--location", help="量测位置（可使用通配符），默认输出所有位置")
+    render.add_argument("-o", "--output", help="图片输出文件夹，默认为数据文件所在文件夹")
+    render.set_defaults(func=render_command)
+
+    backfill = commands.add_parser("backfill", help="批量分析历史数据，相同量测点布局的位置合并计算")
+    backfill.add_argument("directory", nargs="?", help="数据文件夹，默认为配置中的数据文件夹")
+    backfill.add_argument("-b", "--batch", type=int, default=500, help="每批解析的文件数，默认 500")
+    backfill.add_argument("-f", "--force", action="store_true", help="重新分析已有结果文件的数据文件")
+    backfill.add_argument("-e", "--encoding", help="数据文件编码（如 gb2312），指定后不再逐个文件识别编码")
+    backfill.add_argument("--images", action="store_true", help="同时输出二维/三维平整度图")
+    backfill.set_defaults(func=backfill_command)
+
+    events = commands.add_parser("events", help="从事件日志重建结果表或阶段耗时报告")
+    events.add_argument("report", choices=["results", "timings"], help="results：平整度结果表，timings：阶段耗时报告")
+    events.add_argument("log", nargs="?", help="事件日志文件，默认为配置中的 eventLogFile，已轮转的压缩文件一并读取")
+    events.add_argument("-o", "--output", help="结果表保存路径（CSV），默认输出到屏幕")
+    events.add_argument("--since", help="只统计该时间之后的事件，如 2024-05-01 或 2024-05-01T08:00")
+    events.add_argument("--until", help="只统计该时间之前的事件")
+    events.set_defaults(func=events_command)
+
+    images = commands.add_parser("images", help="列出图片归档中的图片或取出单个图片")
+    images.add_argument("archive", help="图片归档文件（.zip）")
+    images.add_argument("name", nargs="?", help="要取出的图片名称，省略时列出所有图片")
+    images.add_argument("-o", "--output", help="图片保存路径，默认为当前文件夹下的同名文件")
+    images.set_defaults(func=images_command)
+
+    args = parser.parse_args(argv)
+    if args.command == 'events' and args.report == 'results' and not args.output and not console:
+        parser.error("没有控制台时无法显示结果表，请使用 -o 指定保存路径")
+    config, _ = read_config()
+    return args.func(config, args)
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1:
+        sys.exit(run_command_line(sys.argv[1:]))
     app = QApplication(sys.argv)
     window = MyMainWindow()
     window.show()
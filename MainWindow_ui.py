@@ -3,7 +3,7 @@
 ################################################################################
 ## Form generated from reading UI file 'MainWindow.ui'
 ##
-## Created by: Qt User Interface Compiler version 6.5.1
+## Created by: Qt User Interface Compiler version 6.6.3
 ##
 ## WARNING! All changes made in this file will be lost when recompiling UI file!
 ################################################################################
@@ -15,9 +15,10 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
     QFont, QFontDatabase, QGradient, QIcon,
     QImage, QKeySequence, QLinearGradient, QPainter,
     QPalette, QPixmap, QRadialGradient, QTransform)
-from PySide6.QtWidgets import (QApplication, QHBoxLayout, QLabel, QLineEdit,
-    QMainWindow, QPlainTextEdit, QPushButton, QSizePolicy,
-    QStatusBar, QVBoxLayout, QWidget)
+from PySide6.QtWidgets import (QAbstractItemView, QApplication, QComboBox, QHBoxLayout,
+    QHeaderView, QLabel, QLineEdit, QMainWindow,
+    QPlainTextEdit, QPushButton, QSizePolicy, QStatusBar,
+    QTabWidget, QTableView, QVBoxLayout, QWidget)
 import resource_rc
 
 class Ui_MainWindow(object):
@@ -50,16 +51,76 @@ class Ui_MainWindow(object):
 
         self.verticalLayout.addLayout(self.horizontalLayout)
 
-        self.horizontalLayout_3 = QHBoxLayout()
+        self.tabWidget = QTabWidget(self.centralwidget)
+        self.tabWidget.setObjectName(u"tabWidget")
+        self.tabLog = QWidget()
+        self.tabLog.setObjectName(u"tabLog")
+        self.horizontalLayout_3 = QHBoxLayout(self.tabLog)
         self.horizontalLayout_3.setObjectName(u"horizontalLayout_3")
-        self.processLog = QPlainTextEdit(self.centralwidget)
+        self.processLog = QPlainTextEdit(self.tabLog)
         self.processLog.setObjectName(u"processLog")
         self.processLog.setReadOnly(True)
 
         self.horizontalLayout_3.addWidget(self.processLog)
 
+        self.tabWidget.addTab(self.tabLog, "")
+        self.tabResults = QWidget()
+        self.tabResults.setObjectName(u"tabResults")
+        self.verticalLayout_2 = QVBoxLayout(self.tabResults)
+        self.verticalLayout_2.setObjectName(u"verticalLayout_2")
+        self.horizontalLayout_4 = QHBoxLayout()
+        self.horizontalLayout_4.setObjectName(u"horizontalLayout_4")
+        self.labelSn = QLabel(self.tabResults)
+        self.labelSn.setObjectName(u"labelSn")
 
-        self.verticalLayout.addLayout(self.horizontalLayout_3)
+        self.horizontalLayout_4.addWidget(self.labelSn)
+
+        self.filterSn = QLineEdit(self.tabResults)
+        self.filterSn.setObjectName(u"filterSn")
+
+        self.horizontalLayout_4.addWidget(self.filterSn)
+
+        self.labelLocation = QLabel(self.tabResults)
+        self.labelLocation.setObjectName(u"labelLocation")
+
+        self.horizontalLayout_4.addWidget(self.labelLocation)
+
+        self.filterLocation = QLineEdit(self.tabResults)
+        self.filterLocation.setObjectName(u"filterLocation")
+
+        self.horizontalLayout_4.addWidget(self.filterLocation)
+
+        self.labelShape = QLabel(self.tabResults)
+        self.labelShape.setObjectName(u"labelShape")
+
+        self.horizontalLayout_4.addWidget(self.labelShape)
+
+        self.filterShape = QComboBox(self.tabResults)
+        self.filterShape.addItem("")
+        self.filterShape.addItem("")
+        self.filterShape.addItem("")
+        self.filterShape.addItem("")
+        self.filterShape.addItem("")
+        self.filterShape.setObjectName(u"filterShape")
+
+        self.horizontalLayout_4.addWidget(self.filterShape)
+
+
+        self.verticalLayout_2.addLayout(self.horizontalLayout_4)
+
+        self.resultsTable = QTableView(self.tabResults)
+        self.resultsTable.setObjectName(u"resultsTable")
+        self.resultsTable.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.resultsTable.setAlternatingRowColors(True)
+        self.resultsTable.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.resultsTable.setSortingEnabled(True)
+        self.resultsTable.setWordWrap(False)
+
+        self.verticalLayout_2.addWidget(self.resultsTable)
+
+        self.tabWidget.addTab(self.tabResults, "")
+
+        self.verticalLayout.addWidget(self.tabWidget)
 
         self.horizontalLayout_2 = QHBoxLayout()
         self.horizontalLayout_2.setSpacing(60)
@@ -92,6 +153,9 @@ class Ui_MainWindow(object):
 
         self.retranslateUi(MainWindow)
 
+        self.tabWidget.setCurrentIndex(0)
+
+
         QMetaObject.connectSlotsByName(MainWindow)
     # setupUi
 
@@ -99,6 +163,19 @@ class Ui_MainWindow(object):
         MainWindow.setWindowTitle(QCoreApplication.translate("MainWindow", u"MainWindow", None))
         self.label.setText(QCoreApplication.translate("MainWindow", u"\u5e73\u6574\u5ea6\u6570\u636e\u6587\u4ef6\u5939\uff1a", None))
         self.btnSelectFolder.setText(QCoreApplication.translate("MainWindow", u"\u9009\u62e9...", None))
+        self.tabWidget.setTabText(self.tabWidget.indexOf(self.tabLog), QCoreApplication.translate("MainWindow", u"\u8fd0\u884c\u65e5\u5fd7", None))
+        self.labelSn.setText(QCoreApplication.translate("MainWindow", u"\u677f\u7f16\u53f7\uff1a", None))
+        self.filterSn.setPlaceholderText(QCoreApplication.translate("MainWindow", u"\u652f\u6301\u901a\u914d\u7b26 * ?", None))
+        self.labelLocation.setText(QCoreApplication.translate("MainWindow", u"\u91cf\u6d4b\u4f4d\u7f6e\uff1a", None))
+        self.filterLocation.setPlaceholderText(QCoreApplication.translate("MainWindow", u"\u652f\u6301\u901a\u914d\u7b26 * ?", None))
+        self.labelShape.setText(QCoreApplication.translate("MainWindow", u"\u4e2d\u5fc3\u5f62\u8c8c\uff1a", None))
+        self.filterShape.setItemText(0, QCoreApplication.translate("MainWindow", u"\u5168\u90e8", None))
+        self.filterShape.setItemText(1, QCoreApplication.translate("MainWindow", u"\u4e2d\u5fc3\u51f8\u8d77", None))
+        self.filterShape.setItemText(2, QCoreApplication.translate("MainWindow", u"\u4e2d\u5fc3\u4e0b\u51f9", None))
+        self.filterShape.setItemText(3, QCoreApplication.translate("MainWindow", u"\u51f9\u51f8\u4e0d\u5e73", None))
+        self.filterShape.setItemText(4, QCoreApplication.translate("MainWindow", u"\u672a\u77e5", None))
+
+        self.tabWidget.setTabText(self.tabWidget.indexOf(self.tabResults), QCoreApplication.translate("MainWindow", u"\u5206\u6790\u7ed3\u679c", None))
         self.btnStart.setText(QCoreApplication.translate("MainWindow", u"\u81ea\u52a8\u5206\u6790\u5e73\u6574\u5ea6", None))
         self.btnStop.setText(QCoreApplication.translate("MainWindow", u"\u505c\u6b62\u5206\u6790\u5e73\u6574\u5ea6", None))
         self.btnExit.setText(QCoreApplication.translate("MainWindow", u"\u5173\u95ed\u7a0b\u5e8f", None))
@@ -0,0 +1,113 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from FlatScan import LeaseManager
+
+TTL = 1.0
+KEYS = [f"line{i % 3}/board{i}.txt" for i in range(40)]
+
+
+def exclusive_create(path, content):
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    os.write(fd, content.encode("utf-8"))
+    os.close(fd)
+    return True
+
+
+def record_duplicate(root, name, key):
+    with open(os.path.join(root, "duplicates.txt"), "a", encoding="utf-8") as f:
+        f.write(f"{name} {key}\n")
+
+
+def station(root, name, crash):
+    # 模拟一个工作站反复扫描同一文件夹：完成的任务写入结果标记，已有标记的任务跳过，与 scan_directory 的流程相同
+    # crash 为 True 的工作站取得第一个租约后直接退出，不释放租约也不再续约
+    leases = LeaseManager(os.path.join(root, "leases"), name, TTL)
+    done_dir = os.path.join(root, "done")
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        remaining = 0
+        for key in KEYS:
+            done = os.path.join(done_dir, key.replace("/", "_"))
+            if os.path.exists(done):
+                continue
+            remaining += 1
+            if not leases.acquire(key):
+                continue
+            if crash:
+                os._exit(1)
+            if os.path.exists(done):
+                leases.release(key)
+                continue
+            # 独占创建处理中标记和结果标记，两个工作站同时处理或重复完成同一任务时记录下来
+            working = os.path.join(root, "working", key.replace("/", "_"))
+            if not exclusive_create(working, name):
+                record_duplicate(root, name, key)
+            else:
+                time.sleep(0.01)
+                if leases.is_held(key) and not exclusive_create(done, name):
+                    record_duplicate(root, name, key)
+                os.remove(working)
+            leases.release(key)
+        if not remaining:
+            break
+        time.sleep(TTL / 4)
+    leases.close()
+
+
+class LeaseManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, "done"))
+        os.makedirs(os.path.join(self.root, "working"))
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_stations_complete_each_key_once(self):
+        # 多个进程共用一个租约文件夹，其中一个持有租约时崩溃：每个任务只完成一次，崩溃遗留的租约过期后被接管
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=station, args=(self.root, f"station{i}", i == 0)) for i in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(90)
+            self.assertFalse(process.is_alive())
+        self.assertEqual(processes[0].exitcode, 1)
+        self.assertTrue(all(process.exitcode == 0 for process in processes[1:]))
+
+        done = sorted(os.listdir(os.path.join(self.root, "done")))
+        self.assertEqual(done, sorted(key.replace("/", "_") for key in KEYS))
+        self.assertFalse(os.path.exists(os.path.join(self.root, "duplicates.txt")))
+        self.assertEqual(os.listdir(os.path.join(self.root, "leases")), [])
+
+    def test_expired_lease_is_taken_over(self):
+        # 持有者停止续约后，租约在 ttl 秒内仍有效，之后被其它工作站接管，原持有者检查时得知已丢失
+        lease_dir = os.path.join(self.root, "leases")
+        first = LeaseManager(lease_dir, "first", TTL)
+        second = LeaseManager(lease_dir, "second", TTL)
+        try:
+            self.assertTrue(first.acquire("board.txt"))
+            first._closed.set()
+            self.assertFalse(second.acquire("board.txt"))
+            time.sleep(TTL * 1.5)
+            self.assertTrue(second.acquire("board.txt"))
+            self.assertTrue(second.is_held("board.txt"))
+            self.assertFalse(first.is_held("board.txt"))
+        finally:
+            first.close()
+            second.close()
+
+
+if __name__ == "__main__":
+    unittest.main()